@@ -1,54 +1,71 @@
-from dataclasses import dataclass
-from functools import cached_property
-from typing import Mapping, MutableMapping, MutableSequence, Sequence
+import bisect
+from concurrent import futures
+import dataclasses
+from dataclasses import dataclass, field
+import re
+import sys
+from typing import AbstractSet, Iterable, Mapping, MutableMapping, MutableSequence, Optional, Sequence
 
 from core import processor, stream_processor
 
 Error = stream_processor.Error
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class _ResultValue(processor.ResultValue):
     value: str
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Position:
     line: int
     column: int
 
-    def after(self, value: str) -> 'Position':
-        line: int = self.line
-        column: int = self.column
-        for c in value:
-            if c == '\n':
-                line += 1
-                column = 0
-            else:
-                column += 1
-        return Position(line, column)
+    @staticmethod
+    def at(newlines: Sequence[int], offset: int) -> 'Position':
+        line: int = bisect.bisect_left(newlines, offset)
+        if line == 0:
+            return Position(0, offset)
+        return Position(line, offset - newlines[line - 1] - 1)
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class _Item:
     value: str
-    position: Position
+    offset: int
+    _newlines: Sequence[int] = field(
+        default=(), compare=False, repr=False)
 
-    def __post_init__(self):
-        if len(self.value) != 1:
-            raise Error(msg=f'invalid lexer item {self.value}')
+    def __repr__(self) -> str:
+        return f'_Item(value={self.value!r}, position={self.position})'
+
+    @property
+    def position(self) -> Position:
+        return Position.at(self._newlines, self.offset)
 
 
+@dataclass(frozen=True, repr=False, eq=False)
 class StateValue(stream_processor.Stream[_Item]):
+    _values: str  # type: ignore[assignment]
+    _newlines: Sequence[int] = field(default=(), compare=False)
+
     def __repr__(self) -> str:
         if self.empty:
             return '[]'
         else:
-            return (''.join([item.value for item in self._values[:10]])+f'@{self._values[0].position}')
+            return (self._values[self._pos:self._pos+10]+f'@{self.head.position}')
+
+    @property
+    def head(self) -> _Item:
+        if self.empty:
+            raise Error(msg='stream empty')
+        return _Item(self._values[self._pos], self._pos, self._newlines)
 
     @property
-    def tail(self) -> stream_processor.Stream[_Item]:
-        return StateValue(super().tail._values)
+    def tail(self) -> 'StateValue':
+        if self.empty:
+            raise Error(msg='stream empty')
+        return StateValue(self._values, self._pos + 1, self._newlines)
 
 
 Result = stream_processor.Result[_ResultValue]
@@ -64,7 +81,7 @@ ZeroOrOne = stream_processor.ZeroOrOne[_ResultValue, _Item]
 UntilEmpty = stream_processor.UntilEmpty[_ResultValue, _Item]
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Token(processor.ResultValue):
     type: str
     value: str
@@ -72,29 +89,217 @@ class Token(processor.ResultValue):
 
 TokenStream = stream_processor.Stream[Token]
 
-_ROOT_RULE_NAME = '_root'
-_RULES_RULE_NAME = '_rules'
+_ROOT_RULE_NAME = sys.intern('_root')
+_RULES_RULE_NAME = sys.intern('_rules')
+_INTERNAL_RULE_NAMES = frozenset({_ROOT_RULE_NAME, _RULES_RULE_NAME})
+_MAX_FIRST_CHARS = 256
 
 
 def load_state_value(s: str) -> StateValue:
-    items: MutableSequence[_Item] = []
-    position: Position = Position(0, 0)
-    for c in s:
-        items.append(_Item(c, position))
-        position = position.after(c)
-    return StateValue(items)
+    newlines: MutableSequence[int] = []
+    offset: int = s.find('\n')
+    while offset != -1:
+        newlines.append(offset)
+        offset = s.find('\n', offset + 1)
+    return StateValue(s, 0, newlines)
+
+
+def _first_chars(rule: Rule, rules: Mapping[str, Rule], visiting: AbstractSet[str] = frozenset()) -> Optional[AbstractSet[str]]:
+    # The chars that rule can start with, or None if it can start with
+    # anything (or nothing).
+    if isinstance(rule, Literal):
+        return {rule.value}
+    elif isinstance(rule, Class):
+        if ord(rule.max) - ord(rule.min) >= _MAX_FIRST_CHARS:
+            return None
+        return {chr(c) for c in range(ord(rule.min), ord(rule.max) + 1)}
+    elif isinstance(rule, processor.Ref):
+        if rule.rule_name in visiting or rule.rule_name not in rules:
+            return None
+        return _first_chars(rules[rule.rule_name], rules, visiting | {rule.rule_name})
+    elif isinstance(rule, processor.And):
+        if not rule.children:
+            return None
+        return _first_chars(rule.children[0], rules, visiting)
+    elif isinstance(rule, processor.Or):
+        chars: set[str] = set()
+        for child in rule.children:
+            child_chars = _first_chars(child, rules, visiting)
+            if child_chars is None:
+                return None
+            chars |= child_chars
+        return chars
+    elif isinstance(rule, processor.OneOrMore):
+        return _first_chars(rule.child, rules, visiting)
+    return None
+
+
+def _min_length(rule: Rule, rules: Mapping[str, Rule], visiting: AbstractSet[str] = frozenset()) -> int:
+    # A lower bound on the number of chars rule consumes when it matches.
+    if isinstance(rule, (Literal, Class, Not)):
+        return 1
+    elif isinstance(rule, processor.Ref):
+        if rule.rule_name in visiting or rule.rule_name not in rules:
+            return 0
+        return _min_length(rules[rule.rule_name], rules, visiting | {rule.rule_name})
+    elif isinstance(rule, processor.And):
+        return sum([_min_length(child, rules, visiting) for child in rule.children])
+    elif isinstance(rule, processor.Or):
+        return min([_min_length(child, rules, visiting) for child in rule.children], default=0)
+    elif isinstance(rule, processor.OneOrMore):
+        return _min_length(rule.child, rules, visiting)
+    return 0
+
+
+def _char_set_pattern(rule: Rule) -> Optional[str]:
+    # The body of a regex char set matching the same single chars as rule,
+    # if rule only ever matches a single Literal or Class char.
+    if isinstance(rule, Literal):
+        return re.escape(rule.value)
+    elif isinstance(rule, Class):
+        # An inverted range never matches but is an error in a regex.
+        if rule.min > rule.max:
+            return None
+        return f'{re.escape(rule.min)}-{re.escape(rule.max)}'
+    elif isinstance(rule, processor.Or) and rule.children:
+        patterns = [_char_set_pattern(child) for child in rule.children]
+        if all(pattern is not None for pattern in patterns):
+            return ''.join([pattern for pattern in patterns if pattern is not None])
+    return None
+
+
+def _char_set(rule: Rule) -> Optional[str]:
+    # A regex char set matching the same single chars as rule, if any.
+    if isinstance(rule, Not):
+        pattern: Optional[str] = _char_set_pattern(rule.child)
+        if pattern is not None:
+            return f'[^{pattern}]'
+        return None
+    pattern = _char_set_pattern(rule)
+    if pattern is not None:
+        return f'[{pattern}]'
+    return None
+
+
+def _fuse_runs(rule: Rule) -> Rule:
+    # Rewrites repetitions of single chars into a _Run that consumes the
+    # whole run in one regex match. Nested Ands and Ors of the same kind
+    # are spliced into their parent too: results are flattened to text, so
+    # only the order of the leaves matters.
+    if isinstance(rule, (processor.ZeroOrMore, processor.OneOrMore)):
+        char_set: Optional[str] = _char_set(rule.child)
+        if char_set is not None:
+            return _Run(rule.child, isinstance(rule, processor.ZeroOrMore), re.compile(
+                f'{char_set}{"*" if isinstance(rule, processor.ZeroOrMore) else "+"}'))
+    elif isinstance(rule, (processor.And, processor.Or)):
+        children: MutableSequence[Rule] = []
+        for child in rule.children:
+            child = _fuse_runs(child)
+            if type(child) is type(rule):
+                assert isinstance(child, (processor.And, processor.Or))
+                children.extend(child.children)
+            else:
+                children.append(child)
+        return dataclasses.replace(rule, children=children)
+    elif isinstance(rule, (processor.ZeroOrMore, processor.OneOrMore, processor.ZeroOrOne, processor.UntilEmpty, Not)):
+        return dataclasses.replace(rule, child=_fuse_runs(rule.child))
+    return rule
+
+
+def _regex(rule: Rule, rules: Mapping[str, Rule], visiting: AbstractSet[str] = frozenset()) -> Optional[str]:
+    # A regex matching exactly what rule matches, or None if rule can't be
+    # expressed as one. PEG repetitions never give back what they consumed
+    # and PEG choices commit to the first matching child, so repetitions
+    # are possessive and choices are atomic groups.
+    if isinstance(rule, Literal):
+        return re.escape(rule.value)
+    elif isinstance(rule, Class):
+        return f'[{re.escape(rule.min)}-{re.escape(rule.max)}]'
+    char_set: Optional[str] = _char_set(rule)
+    if char_set is not None:
+        return char_set
+    elif isinstance(rule, Not):
+        child_regex = _regex(rule.child, rules, visiting)
+        if child_regex is None:
+            return None
+        return f'(?!{child_regex})(?s:.)'
+    elif isinstance(rule, processor.Ref):
+        if rule.rule_name in visiting or rule.rule_name not in rules:
+            return None
+        return _regex(rules[rule.rule_name], rules, visiting | {rule.rule_name})
+    elif isinstance(rule, (processor.And, processor.Or)):
+        child_regexes = [_regex(child, rules, visiting)
+                         for child in rule.children]
+        if any(child_regex is None for child_regex in child_regexes):
+            return None
+        if isinstance(rule, processor.And):
+            return ''.join([f'(?:{child_regex})' for child_regex in child_regexes])
+        return f'(?>{"|".join([f"(?:{child_regex})" for child_regex in child_regexes])})'
+    elif isinstance(rule, (processor.ZeroOrMore, processor.OneOrMore, processor.ZeroOrOne)):
+        child_regex = _regex(rule.child, rules, visiting)
+        if child_regex is None:
+            return None
+        if isinstance(rule, processor.ZeroOrMore):
+            return f'(?:{child_regex})*+'
+        elif isinstance(rule, processor.OneOrMore):
+            return f'(?:{child_regex})++'
+        return f'(?:{child_regex})?+'
+    return None
+
+
+def _compile_regexes(regexes: Sequence[Optional[str]]) -> Optional[re.Pattern[str]]:
+    # One pattern with a group per token rule, or None if any rule has no
+    # regex. Possessive repetitions and atomic groups need Python 3.11, so
+    # older versions reject the pattern and lex through the rules instead.
+    if not regexes or any(regex is None for regex in regexes):
+        return None
+    try:
+        return re.compile('|'.join([f'({regex})' for regex in regexes]))
+    except re.error:
+        return None
+
+
+@dataclass(frozen=True)
+class _DispatchOr(Or):
+    # Candidate (rule, min length) pairs by first char.
+    table: Mapping[str, Sequence[tuple[Rule, int]]] = field(
+        compare=False, repr=False)
+    default: Sequence[tuple[Rule, int]] = field(compare=False, repr=False)
+
+    def apply(self, state: State) -> ResultAndState:
+        value: StateValue = state.value
+        if not value.empty:
+            remaining: int = len(value._values) - value._pos
+            for child, min_length in self.table.get(value._values[value._pos], self.default):
+                if min_length > remaining:
+                    continue
+                child_result: Optional[ResultAndState] = child.try_apply(
+                    state)
+                if child_result is not None:
+                    return child_result.as_child_result()
+        return super().apply(state)
 
 
 @dataclass(frozen=True, init=False)
 class Lexer(stream_processor.Processor[_ResultValue, _Item]):
+    token_rules: Mapping[str, Rule] = field(
+        init=False, compare=False, repr=False)
+    token_types: Sequence[str] = field(init=False, compare=False, repr=False)
+    _token_type_set: AbstractSet[str] = field(
+        init=False, compare=False, repr=False)
+    _pattern: Optional[re.Pattern[str]] = field(
+        init=False, compare=False, repr=False)
+
     @staticmethod
     def _flatten_result_value(result: Result) -> str:
-        value: str = ''
-        if result.value is not None:
-            value += result.value.value
-        for child in result:
-            value += Lexer._flatten_result_value(child)
-        return value
+        values: MutableSequence[str] = []
+        results: MutableSequence[Result] = [result]
+        while results:
+            result = results.pop()
+            if result.value is not None:
+                values.append(result.value.value)
+            results.extend(reversed(result.children))
+        return ''.join(values)
 
     @staticmethod
     def _token_from_result(result: Result) -> Token:
@@ -103,45 +308,108 @@ class Lexer(stream_processor.Processor[_ResultValue, _Item]):
 
     def _token_stream_from_result(self, result: Result) -> TokenStream:
         token_results: Sequence[Result] = list(
-            result.where(Result.rule_name_in(self.token_types)))
+            result.where(Result.rule_name_in(self._token_type_set)))
         return TokenStream(
-            [
+            tuple([
                 token for token in
                 [self._token_from_result(token_result)
                  for token_result in token_results]
                 if not token.type.startswith('_')
-            ]
+            ])
         )
 
     def __init__(self, rules: Mapping[str, Rule]):
-        processor_rules: MutableMapping[str, Rule] = dict(rules)
+        # Token types are compared against parser literals and rule name
+        # sets for every token, so share one string object per name.
+        rules = {sys.intern(rule_name): rule for rule_name,
+                 rule in rules.items()}
+        processor_rules: MutableMapping[str, Rule] = {
+            rule_name: _fuse_runs(rule) for rule_name, rule in rules.items()}
         processor_rules[_ROOT_RULE_NAME] = UntilEmpty(Ref(_RULES_RULE_NAME))
-        processor_rules[_RULES_RULE_NAME] = Or(
-            [Ref(rule_name) for rule_name in rules.keys()])
+        refs: Sequence[Ref] = [Ref(rule_name) for rule_name in rules.keys()]
+        first_chars: Sequence[Optional[AbstractSet[str]]] = [
+            _first_chars(rule, rules) for rule in rules.values()]
+        min_lengths: Sequence[int] = [
+            _min_length(rule, rules) for rule in rules.values()]
+        chars: AbstractSet[str] = set[str]().union(
+            *[chars for chars in first_chars if chars is not None])
+        processor_rules[_RULES_RULE_NAME] = _DispatchOr(
+            refs,
+            {
+                c: [(ref, min_length) for ref, chars, min_length in zip(refs, first_chars, min_lengths)
+                    if chars is None or c in chars]
+                for c in chars
+            },
+            [(ref, min_length) for ref, chars, min_length in zip(
+                refs, first_chars, min_lengths) if chars is None],
+        )
         super().__init__(_ROOT_RULE_NAME, processor_rules)
+        object.__setattr__(self, 'token_rules', {
+            rule_name: rule for rule_name, rule in processor_rules.items()
+            if rule_name not in _INTERNAL_RULE_NAMES})
+        object.__setattr__(self, 'token_types', list(self.token_rules.keys()))
+        object.__setattr__(self, '_token_type_set',
+                           frozenset(self.token_types))
+        regexes: Sequence[Optional[str]] = [
+            _regex(rule, rules) for rule in rules.values()]
+        object.__setattr__(self, '_pattern', _compile_regexes(regexes))
 
     def __repr__(self) -> str:
         return f'Lexer({self.token_rules})'
 
-    @cached_property
-    def token_rules(self) -> Mapping[str, Rule]:
-        return {rule_name: rule for rule_name, rule in self.rules.items() if rule_name not in (_ROOT_RULE_NAME, _RULES_RULE_NAME)}
-
-    @cached_property
-    def token_types(self) -> Sequence[str]:
-        return list(self.token_rules.keys())
-
     def apply(self, input: str) -> TokenStream:
+        if self._pattern is not None:
+            token_types: Sequence[str] = self.token_types
+            tokens: MutableSequence[Token] = []
+            pos: int = 0
+            for match in self._pattern.finditer(input):
+                if match.start() != pos or match.end() == pos:
+                    break
+                assert match.lastindex is not None
+                token_type: str = token_types[match.lastindex - 1]
+                if not token_type.startswith('_'):
+                    tokens.append(Token(token_type, match.group()))
+                pos = match.end()
+            if pos == len(input):
+                return TokenStream(tuple(tokens))
         return self._token_stream_from_result(self.apply_root(load_state_value(input)).result)
 
+    def apply_batch(
+        self,
+        inputs: Iterable[str],
+        max_workers: Optional[int] = None,
+        chunksize: int = 8,
+    ) -> Sequence[TokenStream]:
+        # Independent inputs are lexed in worker processes to sidestep the
+        # GIL. Each worker gets the lexer once from its initializer, so the
+        # chunks sent to it only carry inputs.
+        with futures.ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=_init_batch_worker,
+                initargs=(self,)) as executor:
+            return list(executor.map(_apply_in_batch_worker, inputs, chunksize=chunksize))
 
-@dataclass(frozen=True)
+
+_batch_lexer: Optional[Lexer] = None
+
+
+def _init_batch_worker(lexer: Optional[Lexer]) -> None:
+    global _batch_lexer
+    _batch_lexer = lexer
+
+
+def _apply_in_batch_worker(input: str) -> TokenStream:
+    assert _batch_lexer is not None
+    return _batch_lexer.apply(input)
+
+
+@dataclass(frozen=True, slots=True)
 class HeadRule(stream_processor.HeadRule[_ResultValue, _Item]):
     def result(self, head: _Item) -> Result:
-        return Result(value=_ResultValue(head.value))
+        return processor.Result(value=_ResultValue(head.value))
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Class(HeadRule):
     min: str
     max: str
@@ -153,7 +421,7 @@ class Class(HeadRule):
         return self.min <= head.value <= self.max
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Literal(HeadRule):
     value: str
 
@@ -167,7 +435,7 @@ class Literal(HeadRule):
         return self.value == head.value
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Not(Rule):
     child: Rule
 
@@ -175,13 +443,34 @@ class Not(Rule):
         return f'^{self.child}'
 
     def apply(self, state: State) -> ResultAndState:
-        if state.value.empty:
+        value: StateValue = state.value
+        if value.empty:
             raise Error(msg='state empty')
-        try:
-            child_result: ResultAndState = self.child.apply(state)
-        except Error:
-            return ResultAndState(
-                Result(value=_ResultValue(state.value.head.value)),
-                state.with_value(state.value.tail)
+        child_result: Optional[ResultAndState] = self.child.try_apply(state)
+        if child_result is None:
+            return processor.ResultAndState(
+                processor.Result(value=_ResultValue(value._values[value._pos])),
+                state.with_value(value.tail)
             )
         raise Error(msg=f'child applied: {child_result}')
+
+
+@dataclass(frozen=True, slots=True)
+class _Run(Rule):
+    child: Rule
+    allow_empty: bool
+    _pattern: re.Pattern[str] = field(compare=False, repr=False)
+
+    def __repr__(self) -> str:
+        return f'{self.child}{"*" if self.allow_empty else "+"}'
+
+    def apply(self, state: State) -> ResultAndState:
+        value: StateValue = state.value
+        match = self._pattern.match(value._values, value._pos)
+        if match is None:
+            return self.child.apply(state)
+        return processor.ResultAndState(
+            processor.Result(value=_ResultValue(match.group())),
+            state.with_value(StateValue(
+                value._values, match.end(), value._newlines))
+        )
@@ -4,6 +4,22 @@ from unittest import TestCase
 from . import lexer
 
 
+class ClassTest(TestCase):
+    def test_pred(self):
+        for rule, value, expected in [
+            (lexer.Class('a', 'z'), 'a', True),
+            (lexer.Class('a', 'z'), 'm', True),
+            (lexer.Class('a', 'z'), 'z', True),
+            (lexer.Class('a', 'z'), 'A', False),
+            (lexer.Class('a', 'z'), '\u00e9', False),
+            (lexer.Class('\u00e0', '\u00ff'), '\u00e9', True),
+            (lexer.Class('\u0100', '\u017f'), '\u0101', True),
+            (lexer.Class('\u0100', '\u017f'), 'a', False),
+        ]:
+            with self.subTest((rule, value, expected)):
+                self.assertEqual(rule.pred(lexer._Item(value, 0)), expected)
+
+
 # TODO LiteralTest(RuleTest)
 
 # TODO NotTest(RuleTest)
@@ -28,8 +44,92 @@ class LexerTest(TestCase):
                     lexer.TokenStream(output)
                 )
 
+    def test_inverted_class(self):
+        lexer_ = lexer.Lexer({
+            'a': lexer.OneOrMore(lexer.Class('z', 'a')),
+            'b': lexer.Literal('b'),
+        })
+        self.assertEqual(lexer_.apply('b'),
+                         lexer.TokenStream([lexer.Token('b', 'b')]))
+        with self.assertRaises(lexer.Error):
+            lexer_.apply('a')
+
     def test_paren_literal(self):
         self.assertEqual(
             lexer.Lexer({'(': lexer.Literal('(')}).apply('('),
             lexer.TokenStream([lexer.Token('(', '(')])
         )
+
+    def test_lex_peg_semantics(self):
+        input: str
+        output: Sequence[lexer.Token]
+        for input, output in [
+            ('"a b"', [lexer.Token('str', '"a b"')]),
+            ('ab', [lexer.Token('a', 'a'), lexer.Token('b', 'b')]),
+            ('cc', [lexer.Token('c', 'cc')]),
+        ]:
+            with self.subTest((input, output)):
+                self.assertEqual(
+                    lexer.Lexer({
+                        'str': lexer.And([
+                            lexer.Literal('"'),
+                            lexer.ZeroOrMore(lexer.Not(lexer.Literal('"'))),
+                            lexer.Literal('"'),
+                        ]),
+                        'a': lexer.Or([
+                            lexer.Literal('a'),
+                            lexer.And([lexer.Literal('a'), lexer.Literal('b')]),
+                        ]),
+                        'b': lexer.Literal('b'),
+                        'c': lexer.OneOrMore(lexer.Literal('c')),
+                    }).apply(input),
+                    lexer.TokenStream(output)
+                )
+
+    def test_lex_error(self):
+        for input in ['d', 'aa']:
+            with self.subTest(input):
+                with self.assertRaises(lexer.Error):
+                    lexer.Lexer({
+                        'a': lexer.And([
+                            lexer.ZeroOrMore(lexer.Literal('a')),
+                            lexer.Literal('a'),
+                        ]),
+                    }).apply(input)
+
+    def test_apply_batch_worker(self):
+        lexer_ = lexer.Lexer({
+            'a': lexer.Literal('a'),
+            'b': lexer.OneOrMore(lexer.Literal('c')),
+        })
+        inputs: Sequence[str] = ['a', 'cc', 'acc', 'ca']
+        # Runs the worker side in process rather than starting a pool.
+        lexer._init_batch_worker(lexer_)
+        self.addCleanup(lexer._init_batch_worker, None)
+        self.assertEqual(
+            [lexer._apply_in_batch_worker(input) for input in inputs],
+            [lexer_.apply(input) for input in inputs]
+        )
+
+    def test_nested_and_or(self):
+        lexer_ = lexer.Lexer({
+            'a': lexer.And([
+                lexer.And([lexer.Literal('a'), lexer.Literal('b')]),
+                lexer.Or([
+                    lexer.Or([lexer.Literal('c'), lexer.Literal('d')]),
+                    lexer.Literal('e'),
+                ]),
+            ]),
+        })
+        self.assertEqual(
+            lexer_.rules['a'],
+            lexer.And([
+                lexer.Literal('a'),
+                lexer.Literal('b'),
+                lexer.Or([lexer.Literal('c'), lexer.Literal('d'), lexer.Literal('e')]),
+            ])
+        )
+        for input in ['abc', 'abd', 'abe']:
+            with self.subTest(input):
+                self.assertEqual(lexer_.apply(input),
+                                 lexer.TokenStream([lexer.Token('a', input)]))
@@ -1,17 +1,79 @@
 from core import lexer, parser, processor
-from typing import Callable, Mapping, MutableMapping, MutableSequence, Optional, OrderedDict, Sequence
+import functools
+from dataclasses import dataclass, field
+from typing import AbstractSet, Callable, Mapping, MutableMapping, MutableSequence, Optional, Sequence
 
 
-def load_lexer_rule(input: str) -> lexer.Rule:
-    operators = '()[-]+?*!^|\\'
-    operator_rules: Mapping[str, lexer.Rule] = {
-        operator:
-        lexer.Literal(operator) for operator in operators}
-    lexer_rules: MutableMapping[str, lexer.Rule] = dict(operator_rules)
-    lexer_rules['literal'] = lexer.Not(
-        lexer.Or(list[lexer.Rule](operator_rules.values())))
-    lexer_lexer = lexer.Lexer(lexer_rules)
-    lexer_parser = parser.Parser(
+def _where(result: parser.Result, rule_names: AbstractSet[str]) -> Sequence[parser.Result]:
+    # Same pruned pre-order walk as Result.where, without building a
+    # predicate closure and wrapper Result per lookup.
+    results: MutableSequence[parser.Result] = []
+    stack: MutableSequence[parser.Result] = [result]
+    while stack:
+        result = stack.pop()
+        if result.rule_name in rule_names:
+            results.append(result)
+        else:
+            stack.extend(reversed(result.children))
+    return results
+
+
+def _where_one(result: parser.Result, rule_names: AbstractSet[str]) -> parser.Result:
+    results: Sequence[parser.Result] = _where(result, rule_names)
+    if len(results) != 1:
+        raise processor.Error(
+            msg=f'result count mismatch expected 1 got {len(results)} for {set(rule_names)} from {result}')
+    return results[0]
+
+
+def _index(result: parser.Result, rule_names: AbstractSet[str]) -> Mapping[str, Sequence[parser.Result]]:
+    # Groups the results for several sibling rule names in one walk.
+    index: MutableMapping[str, MutableSequence[parser.Result]] = {}
+    for child in _where(result, rule_names):
+        assert child.rule_name is not None
+        index.setdefault(child.rule_name, []).append(child)
+    return index
+
+
+def _one(index: Mapping[str, Sequence[parser.Result]], rule_name: str) -> parser.Result:
+    results: Sequence[parser.Result] = index.get(rule_name, ())
+    if len(results) != 1:
+        raise processor.Error(
+            msg=f'result count mismatch expected 1 got {len(results)} for {rule_name}')
+    return results[0]
+
+
+_RULE: AbstractSet[str] = frozenset({'rule'})
+_LEXER_OPERAND: AbstractSet[str] = frozenset({'operand', 'unary_operand'})
+_SPECIAL_VALUE: AbstractSet[str] = frozenset({'special_value'})
+_STR: AbstractSet[str] = frozenset({'str'})
+_ID: AbstractSet[str] = frozenset({'id'})
+_UNARY_OPERAND: AbstractSet[str] = frozenset({'unary_operand'})
+_PARSER_OPERAND: AbstractSet[str] = frozenset({'operand'})
+_RULE_DECL: AbstractSet[str] = frozenset({'rule_decl'})
+_PARSER_RULE_DECL_PARTS: AbstractSet[str] = frozenset(
+    {'parser_rule_decl_name', 'rule'})
+_LEXER_RULE_DECL_PARTS: AbstractSet[str] = frozenset({'id', 'str'})
+
+
+@functools.lru_cache(maxsize=None)
+def _literal(value: str) -> lexer.Rule:
+    # Rules are immutable, so every occurrence of a char shares one Literal.
+    return lexer.Literal(value)
+
+
+_OPERATOR_RULES: Mapping[str, lexer.Rule] = {
+    operator: _literal(operator) for operator in '()[-]+?*!^|\\'}
+_LITERAL_RULE: lexer.Rule = lexer.Not(
+    lexer.Or(list[lexer.Rule](_OPERATOR_RULES.values())))
+_LEXER_RULE_LEXER: lexer.Lexer = lexer.Lexer(
+    {**_OPERATOR_RULES, 'literal': _LITERAL_RULE})
+
+
+@functools.cache
+def _load_lexer_rule_parser() -> parser.Parser:
+    # Built on first use rather than at import.
+    return parser.Parser(
         'root',
         {
             'root':   parser.UntilEmpty(parser.Ref('rule')),
@@ -85,68 +147,131 @@ def load_lexer_rule(input: str) -> lexer.Rule:
             ]),
             'special_value': parser.Any(),
         },
-        lexer_lexer
+        _LEXER_RULE_LEXER
     )
 
-    def load_literal(result: parser.Result) -> lexer.Rule:
-        assert result.rule_name == 'literal' and result.value is not None, result
-        return lexer.Literal(result.value.value)
-
-    def load_and(result: parser.Result) -> lexer.Rule:
-        children: MutableSequence[lexer.Rule] = []
-        for rule in result.where(parser.Result.rule_name_is('rule')):
-            children.append(load_rule(rule))
-        return lexer.And(children)
-
-    def load_or(result: parser.Result) -> lexer.Rule:
-        return lexer.Or([load_rule(rule) for rule in result.where(parser.Result.rule_name_is('rule'))])
-
-    def load_operation(factory: Callable[[lexer.Rule], lexer.Rule]) -> Callable[[parser.Result], lexer.Rule]:
-        return lambda result: factory(load_rule(result.where_one(parser.Result.rule_name_in(('operand', 'unary_operand')))))
-
-    def load_class(result: parser.Result) -> lexer.Rule:
-        min, max = result.where(parser.Result.rule_name_is('literal'))
-        assert min.value is not None and max.value is not None
-        return lexer.Class(min.value.value, max.value.value)
-
-    def load_special(result: parser.Result) -> lexer.Rule:
-        value = result.where_one(
-            parser.Result.rule_name_is('special_value')).get_value().value
-        values: Mapping[str, lexer.Rule] = {
-            'n': lexer.Literal('\n'),
-            'w': lexer.Or([lexer.Literal(c) for c in ' \n\t']),
-        }
-        if value in values:
-            return values[value]
-        return lexer.Literal(value)
-
-    rule_funcs: Mapping[str, Callable[[parser.Result], lexer.Rule]] = {
-        'literal': load_literal,
-        'and': load_and,
-        'or': load_or,
-        'zero_or_more': load_operation(lexer.ZeroOrMore),
-        'one_or_more': load_operation(lexer.OneOrMore),
-        'zero_or_one': load_operation(lexer.ZeroOrOne),
-        'until_empty': load_operation(lexer.UntilEmpty),
-        'not': load_operation(lexer.Not),
-        'class': load_class,
-        'special': load_special,
-    }
-
-    def load_rule(result: parser.Result) -> lexer.Rule:
-        rule_result = result.where_one(
-            parser.Result.rule_name_in(list(rule_funcs.keys())))
-        assert rule_result.rule_name is not None
-        return rule_funcs[rule_result.rule_name](rule_result)
-
-    return load_and(lexer_parser.apply(input))
+
+def _load_lexer_rule_literal(result: parser.Result, children: Sequence[lexer.Rule]) -> lexer.Rule:
+    assert result.rule_name == 'literal' and result.value is not None, result
+    return _literal(result.value.value)
+
+
+# Lexer results are flattened to their text, so an And or Or wrapping a
+# single rule matches the same tokens as the rule itself and is dropped.
+
+
+def _load_lexer_rule_and(result: parser.Result, children: Sequence[lexer.Rule]) -> lexer.Rule:
+    return children[0] if len(children) == 1 else lexer.And(tuple(children))
+
+
+def _load_lexer_rule_or(result: parser.Result, children: Sequence[lexer.Rule]) -> lexer.Rule:
+    return children[0] if len(children) == 1 else lexer.Or(tuple(children))
+
+
+def _load_lexer_rule_operation(factory: Callable[[lexer.Rule], lexer.Rule], result: parser.Result, children: Sequence[lexer.Rule]) -> lexer.Rule:
+    return factory(children[0])
+
+
+def _load_lexer_rule_class(result: parser.Result, children: Sequence[lexer.Rule]) -> lexer.Rule:
+    # class is the fixed sequence '[' literal '-' literal ']', and each
+    # Literal's token result sits under its child wrapper.
+    parts: Sequence[parser.Result] = result.children
+    return lexer.Class(
+        parts[1].children[0].get_value().value,
+        parts[3].children[0].get_value().value,
+    )
+
+
+_SPECIAL_VALUES: Mapping[str, lexer.Rule] = {
+    'n': _literal('\n'),
+    'w': lexer.Or(tuple([_literal(c) for c in ' \n\t'])),
+}
+
+
+def _load_lexer_rule_special(result: parser.Result, children: Sequence[lexer.Rule]) -> lexer.Rule:
+    value = _where_one(result, _SPECIAL_VALUE).get_value().value
+    if value in _SPECIAL_VALUES:
+        return _SPECIAL_VALUES[value]
+    return _literal(value)
+
+
+_LEXER_RULE_FUNCS: Mapping[str, Callable[[parser.Result, Sequence[lexer.Rule]], lexer.Rule]] = {
+    'literal': _load_lexer_rule_literal,
+    'and': _load_lexer_rule_and,
+    'or': _load_lexer_rule_or,
+    'zero_or_more': functools.partial(_load_lexer_rule_operation, lexer.ZeroOrMore),
+    'one_or_more': functools.partial(_load_lexer_rule_operation, lexer.OneOrMore),
+    'zero_or_one': functools.partial(_load_lexer_rule_operation, lexer.ZeroOrOne),
+    'until_empty': functools.partial(_load_lexer_rule_operation, lexer.UntilEmpty),
+    'not': functools.partial(_load_lexer_rule_operation, lexer.Not),
+    'class': _load_lexer_rule_class,
+    'special': _load_lexer_rule_special,
+}
+_LEXER_RULE_FUNC_NAMES: AbstractSet[str] = frozenset(_LEXER_RULE_FUNCS)
+
+# The results holding each kind of rule's child rules, if it has any.
+_LEXER_RULE_CHILDREN: Mapping[str, AbstractSet[str]] = {
+    'and': _RULE,
+    'or': _RULE,
+    'zero_or_more': _LEXER_OPERAND,
+    'one_or_more': _LEXER_OPERAND,
+    'zero_or_one': _LEXER_OPERAND,
+    'until_empty': _LEXER_OPERAND,
+    'not': _LEXER_OPERAND,
+}
+
+
+def _load_lexer_rule_tree(result: parser.Result) -> lexer.Rule:
+    # Post-order walk with an explicit stack so deeply nested rules don't
+    # hit the recursion limit. Each entry's children are expanded the first
+    # time it's popped and its rule is built the second time, from the
+    # child rules left on top of the built stack.
+    stack: MutableSequence[tuple[str, parser.Result,
+                                 Optional[int]]] = [('and', result, None)]
+    built: MutableSequence[lexer.Rule] = []
+    while stack:
+        rule_name, node, num_children = stack.pop()
+        if num_children is None:
+            children: Sequence[parser.Result] = [
+                _where_one(child, _LEXER_RULE_FUNC_NAMES)
+                for child in _where(node, _LEXER_RULE_CHILDREN[rule_name])
+            ] if rule_name in _LEXER_RULE_CHILDREN else []
+            stack.append((rule_name, node, len(children)))
+            for child in reversed(children):
+                assert child.rule_name is not None
+                stack.append((child.rule_name, child, None))
+        else:
+            start: int = len(built) - num_children
+            rule: lexer.Rule = _LEXER_RULE_FUNCS[rule_name](
+                node, built[start:])
+            del built[start:]
+            built.append(rule)
+    return built[0]
+
+
+@functools.lru_cache(maxsize=1024)
+def load_lexer_rule(input: str) -> lexer.Rule:
+    # A lone literal char or escape is a common rule and always loads to a
+    # single rule, so skip the meta-lexer and meta-parser for it.
+    if len(input) == 1 and input not in _OPERATOR_RULES:
+        return _literal(input)
+    if len(input) == 2 and input[0] == '\\':
+        return _SPECIAL_VALUES.get(input[1]) or _literal(input[1])
+    return _load_lexer_rule_tree(_load_lexer_rule_parser().apply(input))
 
 
 def load_lexer(rules: Mapping[str, str]) -> lexer.Lexer:
-    return lexer.Lexer({name: load_lexer_rule(value) for name, value in rules.items()})
+    # Rule order sets lexing priority, so the cache key keeps it.
+    return _load_lexer(tuple(rules.items()))
 
 
-def load_parser(input: str) -> parser.Parser:
+@functools.lru_cache(maxsize=128)
+def _load_lexer(rules: tuple[tuple[str, str], ...]) -> lexer.Lexer:
+    return lexer.Lexer({name: load_lexer_rule(value) for name, value in rules})
+
+
+@functools.cache
+def _load_parser_parser() -> parser.Parser:
     try:
         parser_lexer: lexer.Lexer = load_lexer({
             '_ws': r'\w+',
@@ -167,7 +292,7 @@ def load_parser(input: str) -> parser.Parser:
         raise processor.Error(
             msg='failed to load parser lexer', children=[error])
 
-    parser_parser: parser.Parser = parser.Parser(
+    return parser.Parser(
         'root',
         {
             'root': parser.UntilEmpty(parser.Ref('line')),
@@ -247,106 +372,126 @@ def load_parser(input: str) -> parser.Parser:
         parser_lexer
     )
 
+
+def _str_value(result: parser.Result) -> str:
+    # str tokens always lex as one quote, non-quote chars, and one quote, so
+    # slicing strips the quotes without scanning like str.strip.
+    return result.get_value().value[1:-1]
+
+
+@dataclass
+class _ParserContext:
+    # Literals used inline in parser rules lex before declared lexer rules,
+    # most recently seen first, so they're kept apart until the lexer is
+    # built.
+    literal_rules: MutableMapping[str, lexer.Rule] = field(
+        default_factory=dict[str, lexer.Rule])
+    lexer_rules: MutableMapping[str, lexer.Rule] = field(
+        default_factory=dict[str, lexer.Rule])
+    parser_rules: MutableMapping[str, parser.Rule] = field(
+        default_factory=dict[str, parser.Rule])
+    root_rule_name: Optional[str] = None
+
+
+def _load_parser_lexer_literal(context: _ParserContext, result: parser.Result) -> parser.Rule:
+    value: str = _str_value(_where_one(result, _STR))
+    if value in context.lexer_rules:
+        assert context.lexer_rules[value] == load_lexer_rule(value), (
+            value, context.lexer_rules[value])
+    elif value not in context.literal_rules:
+        context.literal_rules[value] = load_lexer_rule(value)
+    return parser.Literal(value)
+
+
+def _load_parser_unary_operation(factory: Callable[[parser.Rule], parser.Rule], context: _ParserContext, result: parser.Result) -> parser.Rule:
+    return factory(_load_parser_rule(context, _where_one(result, _UNARY_OPERAND)))
+
+
+def _load_parser_operation(factory: Callable[[Sequence[parser.Rule]], parser.Rule], context: _ParserContext, result: parser.Result) -> parser.Rule:
+    return factory(tuple(_load_parser_rule(context, rule) for rule in _where(result, _PARSER_OPERAND)))
+
+
+def _load_parser_ref(context: _ParserContext, result: parser.Result) -> parser.Rule:
+    rule_name: str = _where_one(result, _ID).get_value().value
+    if rule_name in context.lexer_rules or rule_name in context.literal_rules:
+        return parser.Literal(rule_name)
+    else:
+        return parser.Ref(rule_name)
+
+
+_PARSER_RULE_LOADERS: Mapping[str, Callable[[_ParserContext, parser.Result], parser.Rule]] = {
+    'ref': _load_parser_ref,
+    'and': functools.partial(_load_parser_operation, parser.And),
+    'or': functools.partial(_load_parser_operation, parser.Or),
+    'zero_or_more': functools.partial(_load_parser_unary_operation, parser.ZeroOrMore),
+    'one_or_more': functools.partial(_load_parser_unary_operation, parser.OneOrMore),
+    'zero_or_one': functools.partial(_load_parser_unary_operation, parser.ZeroOrOne),
+    'until_empty': functools.partial(_load_parser_unary_operation, parser.UntilEmpty),
+    'lexer_literal': _load_parser_lexer_literal,
+}
+_PARSER_RULE_LOADER_NAMES: AbstractSet[str] = frozenset(_PARSER_RULE_LOADERS)
+
+
+def _load_parser_rule(context: _ParserContext, result: parser.Result) -> parser.Rule:
+    rule_result = _where_one(result, _PARSER_RULE_LOADER_NAMES)
+    assert rule_result.rule_name is not None
+    return _PARSER_RULE_LOADERS[rule_result.rule_name](context, rule_result)
+
+
+def _load_parser_parser_rule_decl(context: _ParserContext, result: parser.Result) -> None:
+    index = _index(result, _PARSER_RULE_DECL_PARTS)
+    rule_name: str = _where_one(
+        _one(index, 'parser_rule_decl_name'), _ID).get_value().value
+    assert rule_name not in context.lexer_rules and rule_name not in context.literal_rules and rule_name not in context.parser_rules, rule_name
+    rule: parser.Rule = _load_parser_rule(context, _one(index, 'rule'))
+    context.parser_rules[rule_name] = rule
+    if context.root_rule_name is None:
+        context.root_rule_name = rule_name
+
+
+def _load_parser_lexer_rule_decl(context: _ParserContext, result: parser.Result) -> None:
+    index = _index(result, _LEXER_RULE_DECL_PARTS)
+    rule_name: str = _one(index, 'id').get_value().value
+    assert rule_name not in context.lexer_rules and rule_name not in context.literal_rules and rule_name not in context.parser_rules, rule_name
+    rule_def: str = _str_value(_one(index, 'str'))
+    context.lexer_rules[rule_name] = load_lexer_rule(rule_def)
+
+
+_PARSER_RULE_DECL_LOADERS: Mapping[str, Callable[[_ParserContext, parser.Result], None]] = {
+    'lexer_rule_decl': _load_parser_lexer_rule_decl,
+    'parser_rule_decl': _load_parser_parser_rule_decl,
+}
+_PARSER_RULE_DECL_LOADER_NAMES: AbstractSet[str] = frozenset(
+    _PARSER_RULE_DECL_LOADERS)
+
+
+def _load_parser_rule_decl(context: _ParserContext, result: parser.Result) -> None:
+    rule_result = _where_one(result, _PARSER_RULE_DECL_LOADER_NAMES)
+    assert rule_result.rule_name is not None
+    _PARSER_RULE_DECL_LOADERS[rule_result.rule_name](context, rule_result)
+
+
+@functools.lru_cache(maxsize=128)
+def load_parser(input: str) -> parser.Parser:
+    # Loaded parsers are immutable, so callers loading the same grammar
+    # share one instead of rerunning the meta-parser and compiler.
     try:
-        result: parser.Result = parser_parser.apply(input)
+        result: parser.Result = _load_parser_parser().apply(input)
     except processor.Error as error:
         raise processor.Error(msg='failed to load parser', children=[error])
 
-    lexer_rules: OrderedDict[str, lexer.Rule] = OrderedDict()
-    parser_rules: MutableMapping[str, parser.Rule] = {}
-    root_rule_name: Optional[str] = None
+    context = _ParserContext()
 
-    def load_lexer_literal(result: parser.Result) -> parser.Rule:
-        value: str = result.where_one(
-            parser.Result.rule_name_is('str')).get_value().value.strip('"')
-        if value in lexer_rules:
-            assert lexer_rules[value] == load_lexer_rule(
-                value), (value, lexer_rules[value])
-        else:
-            lexer_rules[value] = load_lexer_rule(value)
-            lexer_rules.move_to_end(value, False)
-        return parser.Literal(value)
-
-    def load_unary_operation(factory: Callable[[parser.Rule], parser.Rule]) -> Callable[[parser.Result], parser.Rule]:
-        return lambda result: factory(load_rule(result.where_one(parser.Result.rule_name_is('unary_operand'))))
-
-    load_zero_or_more = load_unary_operation(parser.ZeroOrMore)
-    load_one_or_more = load_unary_operation(parser.OneOrMore)
-    load_zero_or_one = load_unary_operation(parser.ZeroOrOne)
-    load_until_empty = load_unary_operation(parser.UntilEmpty)
-
-    def load_operation(factory: Callable[[Sequence[parser.Rule]], parser.Rule]) -> Callable[[parser.Result], parser.Rule]:
-        def closure(result: parser.Result) -> parser.Rule:
-            return factory([load_rule(rule) for rule in result.where(parser.Result.rule_name_is('operand'))])
-        return closure
-
-    load_or = load_operation(parser.Or)
-    load_and = load_operation(parser.And)
-
-    def load_ref(result: parser.Result) -> parser.Rule:
-        rule_name: str = result.where_one(
-            parser.Result.rule_name_is('id')).get_value().value
-        if rule_name in lexer_rules:
-            return parser.Literal(rule_name)
-        else:
-            return parser.Ref(rule_name)
-
-    def load_rule(result: parser.Result) -> parser.Rule:
-        rule_loaders: Mapping[str, Callable[[parser.Result], parser.Rule]] = {
-            'ref': load_ref,
-            'and': load_and,
-            'or': load_or,
-            'zero_or_more': load_zero_or_more,
-            'one_or_more': load_one_or_more,
-            'zero_or_one': load_zero_or_one,
-            'until_empty': load_until_empty,
-            'lexer_literal': load_lexer_literal,
-        }
-        rule_result = result.where_one(
-            parser.Result.rule_name_in(list(rule_loaders.keys())))
-        assert rule_result.rule_name is not None
-        return rule_loaders[rule_result.rule_name](rule_result)
-
-    def load_parser_rule_decl(result: parser.Result) -> None:
-        rule_name: str = (
-            result
-            .where_one(parser.Result.rule_name_is('parser_rule_decl_name'))
-            .where_one(parser.Result.rule_name_is('id'))
-            .get_value().value)
-        assert rule_name not in lexer_rules and rule_name not in parser_rules, rule_name
-        rule: parser.Rule = load_rule(
-            result.where_one(parser.Result.rule_name_is('rule')))
-        parser_rules[rule_name] = rule
-        nonlocal root_rule_name
-        if root_rule_name is None:
-            root_rule_name = rule_name
-
-    def load_lexer_rule_decl(result: parser.Result) -> None:
-        rule_name: str = result.where_one(
-            parser.Result.rule_name_is('id')).get_value().value
-        assert rule_name not in lexer_rules and rule_name not in parser_rules, rule_name
-        rule_def: str = result.where_one(
-            parser.Result.rule_name_is('str')).get_value().value.strip('"')
-        lexer_rules[rule_name] = load_lexer_rule(rule_def)
-        lexer_rules.move_to_end(rule_name)
-
-    def load_rule_decl(result: parser.Result) -> None:
-        rule_loaders: Mapping[str, Callable[[parser.Result], None]] = {
-            'lexer_rule_decl': load_lexer_rule_decl,
-            'parser_rule_decl': load_parser_rule_decl,
-        }
-        rule_result = result.where_one(
-            parser.Result.rule_name_in(list(rule_loaders.keys())))
-        assert rule_result.rule_name is not None
-        rule_loaders[rule_result.rule_name](rule_result)
-
-    for rule_decl in result.where(parser.Result.rule_name_is('rule_decl')):
+    for rule_decl in _where(result, _RULE_DECL):
         try:
-            load_rule_decl(rule_decl)
+            _load_parser_rule_decl(context, rule_decl)
         except processor.Error as error:
             raise processor.Error(
                 msg=f'failed to {rule_decl}', children=[error])
 
-    assert root_rule_name is not None, 'no root rule name'
+    assert context.root_rule_name is not None, 'no root rule name'
+
+    lexer_rules: Mapping[str, lexer.Rule] = dict(
+        [*reversed(context.literal_rules.items()), *context.lexer_rules.items()])
 
-    return parser.Parser(root_rule_name, parser_rules, lexer.Lexer(lexer_rules))
+    return parser.Parser(context.root_rule_name, context.parser_rules, lexer.Lexer(lexer_rules))
@@ -13,12 +13,7 @@ class LoaderTest(unittest.TestCase):
         input: str
         rule: lexer.Rule
         for input, rule in [
-            (
-                'a',
-                lexer.And([
-                    lexer.Literal('a'),
-                ])
-            ),
+            ('a', lexer.Literal('a')),
             (
                 'ab',
                 lexer.And([
@@ -26,36 +21,25 @@ class LoaderTest(unittest.TestCase):
                     lexer.Literal('b'),
                 ])
             ),
-            (
-                '(a)',
-                lexer.And([
-                    lexer.And([
-                        lexer.Literal('a'),
-                    ])
-                ])
-            ),
+            ('(a)', lexer.Literal('a')),
             (
                 '(ab)',
                 lexer.And([
-                    lexer.And([
-                        lexer.Literal('a'),
-                        lexer.Literal('b'),
-                    ])
+                    lexer.Literal('a'),
+                    lexer.Literal('b'),
                 ])
             ),
-            ('a*', lexer.And([lexer.ZeroOrMore(lexer.Literal('a'))])),
-            ('a+', lexer.And([lexer.OneOrMore(lexer.Literal('a'))])),
-            ('a?', lexer.And([lexer.ZeroOrOne(lexer.Literal('a'))])),
-            ('a!', lexer.And([lexer.UntilEmpty(lexer.Literal('a'))])),
-            ('^a', lexer.And([lexer.Not(lexer.Literal('a'))])),
-            ('[a-z]', lexer.And([lexer.Class('a', 'z')])),
-            ('(a|b)', lexer.And(
-                [lexer.Or([lexer.Literal('a'), lexer.Literal('b')])])),
-            ('\\(', lexer.And([lexer.Literal('(')])),
-            ('\\\\', lexer.And([lexer.Literal('\\')])),
-            ('\\w', lexer.And(
-                [lexer.Or([lexer.Literal(c) for c in ' \n\t'])])),
-            ('\\n', lexer.And([lexer.Literal('\n')])),
+            ('a*', lexer.ZeroOrMore(lexer.Literal('a'))),
+            ('a+', lexer.OneOrMore(lexer.Literal('a'))),
+            ('a?', lexer.ZeroOrOne(lexer.Literal('a'))),
+            ('a!', lexer.UntilEmpty(lexer.Literal('a'))),
+            ('^a', lexer.Not(lexer.Literal('a'))),
+            ('[a-z]', lexer.Class('a', 'z')),
+            ('(a|b)', lexer.Or([lexer.Literal('a'), lexer.Literal('b')])),
+            ('\\(', lexer.Literal('(')),
+            ('\\\\', lexer.Literal('\\')),
+            ('\\w', lexer.Or([lexer.Literal(c) for c in ' \n\t'])),
+            ('\\n', lexer.Literal('\n')),
         ]:
             with self.subTest((input, rule)):
                 self.assertEqual(rule, loader.load_lexer_rule(input))
@@ -66,7 +50,7 @@ class LoaderTest(unittest.TestCase):
         for rule_strs, lexer_ in [
             (
                 {'(': r'\('},
-                lexer.Lexer({'(': lexer.And([lexer.Literal('(')])})
+                lexer.Lexer({'(': lexer.Literal('(')})
             ),
         ]:
             with self.subTest(rule_strs=rule_strs, lexer=lexer_):
@@ -253,3 +237,19 @@ class LoaderTest(unittest.TestCase):
         ]:
             with self.subTest((input, parser_)):
                 self.assertEqual(parser_, loader.load_parser(input))
+
+    def test_load_parser_cached(self):
+        input = r'''
+            a -> "b";
+        '''
+        self.assertIs(loader.load_parser(input), loader.load_parser(input))
+
+    def test_load_lexer_order(self):
+        self.assertEqual(
+            list(loader.load_lexer({'b': 'b', 'a': 'a'}).token_types),
+            ['b', 'a']
+        )
+        self.assertEqual(
+            list(loader.load_lexer({'a': 'a', 'b': 'b'}).token_types),
+            ['a', 'b']
+        )
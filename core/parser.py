@@ -1,6 +1,8 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+import sys
+from typing import Callable, Mapping, MutableMapping, MutableSequence, Optional, Sequence
 
-from core import lexer, stream_processor
+from core import lexer, processor, stream_processor
 
 
 ResultValue = _Item = lexer.Token
@@ -35,19 +37,30 @@ UntilEmpty = stream_processor.UntilEmpty[ResultValue, _Item]
 
 class HeadRule(stream_processor.HeadRule[ResultValue, _Item]):
     def result(self, head: _Item) -> Result:
-        return Result(value=head)
+        return processor.Result(value=head)
 
 
 @dataclass(frozen=True)
 class Literal(HeadRule):
     token_type: str
 
+    def __post_init__(self):
+        # The lexer interns token types, so interning here lets matches
+        # compare by identity.
+        object.__setattr__(self, 'token_type', sys.intern(self.token_type))
+
     def __repr__(self) -> str:
         return f'"{self.token_type}"'
 
     def apply(self, state: State) -> ResultAndState:
         return super().apply(state).with_rule_name(self.token_type).as_child_result()
 
+    def try_apply(self, state: State) -> Optional[ResultAndState]:
+        result: Optional[ResultAndState] = super().try_apply(state)
+        if result is None:
+            return None
+        return result.with_rule_name(self.token_type).as_child_result()
+
     def pred(self, head: _Item) -> bool:
         return head.type == self.token_type
 
@@ -57,9 +70,382 @@ class Any(HeadRule):
         return True
 
 
+_CompiledRule = Callable[
+    [tuple[_Item, ...], tuple[Optional[str], ...], int,
+        MutableMapping[tuple[int, int], Optional[tuple[Result, int]]]],
+    Optional[tuple[Result, int]]]
+
+
+class _Unsupported(Exception):
+    ...
+
+
+class _Compiler:
+    # Generates one Python function per rule node, taking the token tuple,
+    # a parallel tuple of their types ending in None, and an int position
+    # and returning (result, new position) or None. Matching only reads the
+    # types, and the trailing None ends every match without bounds checks.
+    # The results built are identical to the interpreter's.
+
+    def __init__(self, rules: Mapping[str, Rule]):
+        self.rules = rules
+        self.lines: MutableSequence[str] = []
+        self.rule_funcs: MutableMapping[str, str] = {}
+        self.node_funcs: MutableMapping[int, str] = {}
+        self.tail_funcs: MutableSequence[str] = []
+        self.tables: MutableSequence[str] = []
+        self.firsts: MutableMapping[int, Optional[frozenset[str]]] = {}
+
+    def rule_func(self, rule_name: str) -> str:
+        if rule_name not in self.rule_funcs:
+            index = len(self.rule_funcs)
+            func = f'_r{index}'
+            self.rule_funcs[rule_name] = func
+            if rule_name not in self.rules:
+                self.emit(func, ['return None'])
+            else:
+                child = self.node_func(self.rules[rule_name])
+                lines: MutableSequence[str] = []
+                rule_first: Optional[frozenset[str]] = self.first(
+                    self.rules[rule_name])
+                if rule_first is not None:
+                    # Reject on the next token before touching the memo.
+                    lines += [
+                        f'if types[pos] not in {_set_literal(rule_first)}:',
+                        '    return None',
+                    ]
+                apply_lines: Sequence[str] = [
+                    f'r = {child}(tokens, types, pos, memo)',
+                    'if r is not None:',
+                    '    result = r[0]',
+                    f'    r = Result(rule_name={rule_name!r}, value=result.value, children=result.children), r[1]',
+                ]
+                if type(self.rules[rule_name]) in (Literal, Any):
+                    # Matching a single token again costs no more than a
+                    # memo lookup, so these rules aren't memoized.
+                    self.emit(func, [*lines, *apply_lines, 'return r'])
+                else:
+                    # Named rules are memoized by position like the
+                    # interpreter, which keeps backtracking over nested rules
+                    # linear.
+                    self.emit(func, [
+                        *lines,
+                        f'key = ({index}, pos)',
+                        'if key in memo:',
+                        '    return memo[key]',
+                        *apply_lines,
+                        'memo[key] = r',
+                        'return r',
+                    ])
+        return self.rule_funcs[rule_name]
+
+    def node_func(self, rule: Rule) -> str:
+        if id(rule) in self.node_funcs:
+            return self.node_funcs[id(rule)]
+        func = f'_n{len(self.node_funcs)}'
+        self.node_funcs[id(rule)] = func
+        self.emit(func, self.node_body(rule))
+        return func
+
+    def node_body(self, rule: Rule) -> Sequence[str]:
+        # Exact type checks: subclasses may override apply, so anything
+        # unrecognized can't be compiled and falls back to the interpreter.
+        rule_type = type(rule)
+        if rule_type is Literal:
+            assert isinstance(rule, Literal)
+            return [
+                f'if types[pos] == {rule.token_type!r}:',
+                f'    return Result(children=(Result(rule_name={rule.token_type!r}, value=tokens[pos]),)), pos + 1',
+                'return None',
+            ]
+        if rule_type is Any:
+            return [
+                'if types[pos] is not None:',
+                '    return Result(value=tokens[pos]), pos + 1',
+                'return None',
+            ]
+        if rule_type is processor.Ref:
+            assert isinstance(rule, processor.Ref)
+            return [
+                f'r = {self.rule_func(rule.rule_name)}(tokens, types, pos, memo)',
+                'if r is None:',
+                '    return None',
+                'return Result(children=(r[0],)), r[1]',
+            ]
+        if rule_type is processor.And:
+            assert isinstance(rule, processor.And)
+            if len(rule.children) == 1:
+                # Wrappers left by grammar expansion need no children list.
+                return [
+                    f'r = {self.node_func(rule.children[0])}(tokens, types, pos, memo)',
+                    'if r is None:',
+                    '    return None',
+                    'return Result(children=(r[0],)), r[1]',
+                ]
+            lines: MutableSequence[str] = ['children = []']
+            for child in rule.children:
+                lines += [
+                    f'r = {self.node_func(child)}(tokens, types, pos, memo)',
+                    'if r is None:',
+                    '    return None',
+                    'children.append(r[0])',
+                    'pos = r[1]',
+                ]
+            return lines + ['return Result(children=children), pos']
+        if rule_type is processor.Or:
+            assert isinstance(rule, processor.Or)
+            table: Optional[str] = self.dispatch_table(rule)
+            if table is not None:
+                # At most one alternative can start with the next token, so
+                # it's looked up directly instead of testing each in turn.
+                return [
+                    f'f = {table}.get(types[pos])',
+                    'if f is None:',
+                    '    return None',
+                    'r = f(tokens, types, pos, memo)',
+                    'if r is None:',
+                    '    return None',
+                    'return Result(children=(r[0],)), r[1]',
+                ]
+            # Alternatives are skipped without a call when the next token
+            # can't start them, which usually leaves a single one to try.
+            lines = ['t = types[pos]']
+            # Alternatives that start with the same rule share one application
+            # of it, so a common prefix is only matched once per position.
+            heads: Sequence[Optional[Rule]] = [
+                child.children[0]
+                if type(child) is processor.And and child.children else None
+                for child in rule.children]
+            prefixes: MutableMapping[int, str] = {}
+            for child, head in zip(rule.children, heads):
+                child_lines: MutableSequence[str]
+                if head is not None and heads.count(head) > 1:
+                    assert isinstance(child, processor.And)
+                    first: int = heads.index(head)
+                    prefix = f'p{first}'
+                    child_lines = []
+                    if first not in prefixes:
+                        prefixes[first] = prefix
+                        child_lines.append(
+                            f'{prefix} = {self.node_func(head)}(tokens, types, pos, memo)')
+                    child_lines += [
+                        f'if {prefix} is not None:',
+                        f'    r = {self.tail_func(child)}(tokens, types, {prefix}[1], memo)',
+                        '    if r is not None:',
+                        f'        return Result(children=(Result(children=[{prefix}[0], *r[0]]),)), r[1]',
+                    ]
+                else:
+                    child_lines = [
+                        f'r = {self.node_func(child)}(tokens, types, pos, memo)',
+                        'if r is not None:',
+                        '    return Result(children=(r[0],)), r[1]',
+                    ]
+                child_first: Optional[frozenset[str]] = self.first(child)
+                if child_first is None:
+                    lines += child_lines
+                else:
+                    lines.append(f'if t in {_set_literal(child_first)}:')
+                    lines += [f'    {line}' for line in child_lines]
+            return lines + ['return None']
+        if rule_type in (processor.ZeroOrMore, processor.OneOrMore):
+            assert isinstance(
+                rule, (processor.ZeroOrMore, processor.OneOrMore))
+            if type(rule.child) is Literal:
+                # Repeated literals are matched in one loop over the tokens
+                # instead of a call per token.
+                assert isinstance(rule.child, Literal)
+                token_type: str = rule.child.token_type
+                lines = [
+                    'children = []',
+                    f'while types[pos] == {token_type!r}:',
+                    f'    children.append(Result(children=(Result(rule_name={token_type!r}, value=tokens[pos]),)))',
+                    '    pos += 1',
+                ]
+                if rule_type is processor.OneOrMore:
+                    lines += [
+                        'if not children:',
+                        '    return None',
+                    ]
+                return lines + ['return Result(children=children), pos']
+            child = self.node_func(rule.child)
+            lines = ['children = []']
+            if rule_type is processor.OneOrMore:
+                lines += [
+                    f'r = {child}(tokens, types, pos, memo)',
+                    'if r is None:',
+                    '    return None',
+                    'children.append(r[0])',
+                    'pos = r[1]',
+                ]
+            # Stop as soon as the next token can't start another match.
+            child_first = self.first(rule.child)
+            return lines + [
+                'while True:' if child_first is None else
+                f'while types[pos] in {_set_literal(child_first)}:',
+                f'    r = {child}(tokens, types, pos, memo)',
+                '    if r is None:',
+                '        break',
+                '    children.append(r[0])',
+                '    pos = r[1]',
+                'return Result(children=children), pos',
+            ]
+        if rule_type is processor.ZeroOrOne:
+            assert isinstance(rule, processor.ZeroOrOne)
+            lines = [
+                f'r = {self.node_func(rule.child)}(tokens, types, pos, memo)',
+                'if r is None:',
+                '    return Result(), pos',
+                'return Result(children=(r[0],)), r[1]',
+            ]
+            child_first = self.first(rule.child)
+            if child_first is None:
+                return lines
+            return [
+                f'if types[pos] not in {_set_literal(child_first)}:',
+                '    return Result(), pos',
+            ] + lines
+        if rule_type is processor.UntilEmpty:
+            assert isinstance(rule, processor.UntilEmpty)
+            child = self.node_func(rule.child)
+            return [
+                'children = []',
+                'while types[pos] is not None:',
+                f'    r = {child}(tokens, types, pos, memo)',
+                '    if r is None or r[1] == pos:',
+                '        return None',
+                '    children.append(r[0])',
+                '    pos = r[1]',
+                'return Result(children=children), pos',
+            ]
+        raise _Unsupported(rule)
+
+    def first(self, rule: Rule) -> Optional[frozenset[str]]:
+        # The token types that can start a match of rule, or None if that
+        # isn't known, including when rule can match without consuming.
+        if id(rule) not in self.firsts:
+            self.firsts[id(rule)] = None
+            self.firsts[id(rule)] = self._first(rule)
+        return self.firsts[id(rule)]
+
+    def _first(self, rule: Rule) -> Optional[frozenset[str]]:
+        rule_type = type(rule)
+        if rule_type is Literal:
+            assert isinstance(rule, Literal)
+            return frozenset([rule.token_type])
+        if rule_type is processor.Ref:
+            assert isinstance(rule, processor.Ref)
+            if rule.rule_name not in self.rules:
+                return None
+            return self.first(self.rules[rule.rule_name])
+        if rule_type is processor.And:
+            assert isinstance(rule, processor.And)
+            return self.first(rule.children[0]) if rule.children else None
+        if rule_type is processor.Or:
+            assert isinstance(rule, processor.Or)
+            firsts: Sequence[Optional[frozenset[str]]] = [
+                self.first(child) for child in rule.children]
+            if not firsts or None in firsts:
+                return None
+            return frozenset().union(*firsts)
+        if rule_type is processor.OneOrMore:
+            assert isinstance(rule, processor.OneOrMore)
+            return self.first(rule.child)
+        return None
+
+    def dispatch_table(self, rule: processor.Or) -> Optional[str]:
+        # A table from token type to alternative, for Ors whose alternatives
+        # all have known and disjoint FIRST sets.
+        firsts: Sequence[Optional[frozenset[str]]] = [
+            self.first(child) for child in rule.children]
+        if len(firsts) < 2 or None in firsts:
+            return None
+        token_types: Sequence[str] = [
+            token_type for child_first in firsts if child_first is not None
+            for token_type in child_first]
+        if len(set(token_types)) < len(token_types):
+            return None
+        entries: MutableMapping[str, str] = {}
+        for child, child_first in zip(rule.children, firsts):
+            assert child_first is not None
+            entries.update(dict.fromkeys(child_first, self.node_func(child)))
+        table = f'_d{len(self.tables)}'
+        self.tables.append(
+            f'{table} = {{' + ', '.join(f'{token_type!r}: {func}' for token_type, func in sorted(entries.items())) + '}')
+        return table
+
+    def tail_func(self, rule: processor.And) -> str:
+        # Matches all but the first child of an And, returning the children
+        # list and new position, for alternatives with a shared prefix.
+        func = f'_t{len(self.tail_funcs)}'
+        self.tail_funcs.append(func)
+        lines: MutableSequence[str] = ['children = []']
+        for child in rule.children[1:]:
+            lines += [
+                f'r = {self.node_func(child)}(tokens, types, pos, memo)',
+                'if r is None:',
+                '    return None',
+                'children.append(r[0])',
+                'pos = r[1]',
+            ]
+        self.emit(func, lines + ['return children, pos'])
+        return func
+
+    def emit(self, func: str, body: Sequence[str]) -> None:
+        self.lines.append(f'def {func}(tokens, types, pos, memo):')
+        self.lines.extend([f'    {line}' for line in body])
+        self.lines.append('')
+
+
+def _set_literal(values: frozenset[str]) -> str:
+    # A set display of constants in an `in` test compiles to a frozenset
+    # constant, so membership needs no name lookup.
+    return '{' + ', '.join(repr(value) for value in sorted(values)) + '}'
+
+
+def _compile_rules(root_rule_name: str, rules: Mapping[str, Rule]) -> Optional[_CompiledRule]:
+    compiler = _Compiler(rules)
+    try:
+        root = compiler.rule_func(root_rule_name)
+    except _Unsupported:
+        return None
+    namespace: MutableMapping[str, object] = {'Result': processor.Result}
+    # Dispatch tables refer to the generated functions, so they come last.
+    exec(compile('\n'.join([*compiler.lines, *compiler.tables]),
+         f'<parser {root_rule_name}>', 'exec'), namespace)
+    compiled = namespace[root]
+    assert callable(compiled)
+    return compiled
+
+
 @dataclass(frozen=True)
 class Parser(stream_processor.Processor[ResultValue, _Item]):
     lexer: lexer.Lexer
+    _compiled: Optional[_CompiledRule] = field(
+        default=None, init=False, compare=False, repr=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, '_compiled', _compile_rules(
+            self.root_rule_name, self.rules))
+
+    def __getstate__(self) -> Mapping[str, object]:
+        # Generated functions can't be pickled, so they're rebuilt on load.
+        return {name: value for name, value in self.__dict__.items() if name != '_compiled'}
+
+    def __setstate__(self, state: Mapping[str, object]) -> None:
+        self.__dict__.update(state)
+        self.__post_init__()
 
     def apply(self, input: str) -> Result:
-        return self.apply_root(self.lexer.apply(input)).result
+        tokens: StateValue = self.lexer.apply(input)
+        if self._compiled is not None:
+            # The compiled rules signal failure with None rather than
+            # building error trees, so failures are re-run through the
+            # interpreter to raise the same errors it would have.
+            values: tuple[_Item, ...] = tuple(tokens._values)
+            types: tuple[Optional[str], ...] = (
+                *[token.type for token in values], None)
+            result: Optional[tuple[Result, int]] = self._compiled(
+                values, types, tokens._pos, {})
+            if result is not None:
+                return result[0]
+        return self.apply_root(tokens).result
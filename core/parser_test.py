@@ -1,3 +1,6 @@
+import pickle
+from unittest import TestCase
+
 from core import lexer, parser, processor_test
 
 if 'unittest.util' in __import__('sys').modules:
@@ -83,3 +86,130 @@ class ParserTest(processor_test.ProcessorTest[parser.ResultValue, parser.StateVa
                 ),
             ]
         )
+
+
+class CompiledParserTest(TestCase):
+    def setUp(self):
+        self.parser = parser.Parser(
+            'root',
+            {
+                'root': parser.UntilEmpty(parser.Ref('item')),
+                'item': parser.Or([
+                    parser.Ref('list'),
+                    parser.Literal('id'),
+                ]),
+                'list': parser.And([
+                    parser.Literal('('),
+                    parser.ZeroOrMore(parser.Ref('item')),
+                    parser.ZeroOrOne(parser.Literal('id')),
+                    parser.Literal(')'),
+                ]),
+            },
+            lexer.Lexer({
+                '_ws': lexer.OneOrMore(lexer.Literal(' ')),
+                '(': lexer.Literal('('),
+                ')': lexer.Literal(')'),
+                'id': lexer.OneOrMore(lexer.Class('a', 'z')),
+            })
+        )
+
+    def interpret(self, input: str) -> parser.Result:
+        return self.parser.apply_root(self.parser.lexer.apply(input)).result
+
+    def assertMatchesInterpreter(self, parser_: parser.Parser, input: str) -> None:
+        try:
+            expected = parser_.apply_root(parser_.lexer.apply(input)).result
+        except parser.Error:
+            with self.assertRaises(parser.Error):
+                parser_.apply(input)
+        else:
+            self.assertEqual(parser_.apply(input), expected)
+
+    def test_apply(self):
+        for input in ['a', 'a b', '(a (b c) ())', '()', '(' * 20 + 'a' + ')' * 20]:
+            with self.subTest(input):
+                self.assertEqual(self.parser.apply(input),
+                                 self.interpret(input))
+
+    def test_apply_error(self):
+        with self.assertRaises(parser.Error):
+            self.parser.apply('(a')
+
+    def test_pickle(self):
+        parser_: parser.Parser = pickle.loads(pickle.dumps(self.parser))
+        self.assertIsNotNone(parser_._compiled)
+        self.assertEqual(parser_.apply('(a b)'), self.interpret('(a b)'))
+
+    def test_apply_uncompiled(self):
+        class _Literal(parser.Literal):
+            ...
+
+        parser_ = parser.Parser(
+            'root',
+            {'root': parser.OneOrMore(_Literal('id'))},
+            self.parser.lexer
+        )
+        self.assertIsNone(parser_._compiled)
+        self.assertEqual(
+            parser_.apply('a b'),
+            parser_.apply_root(parser_.lexer.apply('a b')).result
+        )
+
+    def test_apply_shared_prefix(self):
+        parser_ = parser.Parser(
+            'root',
+            {
+                'root': parser.UntilEmpty(parser.Or([
+                    parser.And([parser.Literal('('), parser.Literal('id'), parser.Literal(')')]),
+                    parser.And([parser.Literal('('), parser.Literal(')')]),
+                    parser.And([parser.Literal('(')]),
+                    parser.Literal('id'),
+                ])),
+            },
+            self.parser.lexer
+        )
+        self.assertIsNotNone(parser_._compiled)
+        for input in ['(a)', '()', '(', 'a ( () (b)']:
+            with self.subTest(input):
+                self.assertEqual(
+                    parser_.apply(input),
+                    parser_.apply_root(parser_.lexer.apply(input)).result
+                )
+
+    def test_apply_repeated_literal(self):
+        for rule in [parser.ZeroOrMore(parser.Literal('id')), parser.OneOrMore(parser.Literal('id'))]:
+            parser_ = parser.Parser(
+                'root',
+                {'root': parser.And([rule, parser.ZeroOrOne(parser.Literal('('))])},
+                self.parser.lexer
+            )
+            for input in ['', 'a', 'a b c', 'a b (', '(']:
+                with self.subTest(rule=rule, input=input):
+                    self.assertMatchesInterpreter(parser_, input)
+
+    def test_apply_dispatch(self):
+        parser_ = parser.Parser(
+            'root',
+            {
+                'root': parser.UntilEmpty(parser.Or([
+                    parser.And([parser.Literal('('), parser.Literal(')')]),
+                    parser.Literal('id'),
+                    parser.Ref('close'),
+                ])),
+                'close': parser.Literal(')'),
+            },
+            self.parser.lexer
+        )
+        for input in ['', '()', 'a ) b', '(a)', '(']:
+            with self.subTest(input):
+                self.assertMatchesInterpreter(parser_, input)
+
+    def test_apply_single_child_and(self):
+        parser_ = parser.Parser(
+            'root',
+            {'root': parser.UntilEmpty(parser.And([parser.Literal('id')]))},
+            self.parser.lexer
+        )
+        for input in ['', 'a', 'a b', '(']:
+            with self.subTest(input):
+                self.assertMatchesInterpreter(parser_, input)
@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod, abstractproperty
-from dataclasses import dataclass, field
-from typing import Callable, Generic, Iterator, Mapping, MutableSequence, Optional, Sequence, TypeVar
+import functools
+from dataclasses import dataclass, field, replace
+from typing import Callable, Collection, Generic, Hashable, Iterator, Mapping, MutableMapping, MutableSequence, Optional, Sequence, TypeVar, Union
 
 
 @dataclass(frozen=True)
@@ -10,13 +11,19 @@ class Error(Exception):
     children: Sequence['Error'] = field(default_factory=list, kw_only=True)
 
     def __str__(self) -> str:
-        return '\n' + self._str(0)
-
-    def _str(self, indent: int) -> str:
-        if not self.rule_name and not self.msg and len(self.children) == 1:
-            return self.children[0]._str(indent)
-        return (f'{"  "*indent}{self.rule_name if self.rule_name else ""} {self.msg if self.msg else ""}'
-                + '\n' + ''.join([child._str(indent+1) for child in self.children]))
+        # Pre-order walk collecting one line per error, so deep error trees
+        # are neither recursed into nor re-joined at every level.
+        lines: MutableSequence[str] = ['\n']
+        stack: MutableSequence[tuple[Error, int]] = [(self, 0)]
+        while stack:
+            error, indent = stack.pop()
+            while not error.rule_name and not error.msg and len(error.children) == 1:
+                error = error.children[0]
+            lines.append(
+                f'{"  "*indent}{error.rule_name if error.rule_name else ""} {error.msg if error.msg else ""}\n')
+            stack.extend([(child, indent+1)
+                         for child in reversed(error.children)])
+        return ''.join(lines)
 
     def with_rule_name(self, rule_name: str) -> 'Error':
         return Error(msg=self.msg, rule_name=rule_name, children=self.children)
@@ -29,34 +36,77 @@ class ResultValue:
 _ResultValueType = TypeVar('_ResultValueType', bound=ResultValue)
 
 
-@dataclass(frozen=True)
+_NO_RESULTS: Sequence['Result'] = ()
+
+
+@dataclass(frozen=True, init=False, eq=False)
 class Result(Generic[_ResultValueType]):
-    rule_name: Optional[str] = field(default=None, kw_only=True)
-    value: Optional[_ResultValueType] = field(kw_only=True, default=None)
-    children: Sequence['Result[_ResultValueType]'] = field(
-        kw_only=True, default_factory=lambda: list[Result[_ResultValueType]]())
+    # One of these is built per rule application, so keep them slotted and
+    # take the children list as given rather than copying it. Childless
+    # results share one empty tuple, so children compare as sequences.
+    __slots__ = ('rule_name', 'value', 'children')
+
+    rule_name: Optional[str]
+    value: Optional[_ResultValueType]
+    children: Sequence['Result[_ResultValueType]']
+
+    def __init__(
+        self,
+        *,
+        rule_name: Optional[str] = None,
+        value: Optional[_ResultValueType] = None,
+        children: Optional[Sequence['Result[_ResultValueType]']] = None,
+    ) -> None:
+        object.__setattr__(self, 'rule_name', rule_name)
+        object.__setattr__(self, 'value', value)
+        object.__setattr__(self, 'children', _NO_RESULTS if children is None else children)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Result):
+            return NotImplemented
+        return (self.rule_name == other.rule_name
+                and self.value == other.value
+                and tuple(self.children) == tuple(other.children))
+
+    def __getstate__(self) -> tuple[object, ...]:
+        return self.rule_name, self.value, self.children
+
+    def __setstate__(self, state: tuple[object, ...]) -> None:
+        for name, value in zip(Result.__slots__, state):
+            object.__setattr__(self, name, value)
 
     def __iter__(self) -> Iterator['Result[_ResultValueType]']:
         return self.children.__iter__()
 
     def with_rule_name(self, rule_name: str) -> 'Result[_ResultValueType]':
-        return Result[_ResultValueType](value=self.value, children=self.children, rule_name=rule_name)
+        # Results are immutable, so one that already has the name is reused.
+        if self.rule_name == rule_name:
+            return self
+        return Result(value=self.value, children=self.children, rule_name=rule_name)
 
     def where(self, pred: Callable[['Result[_ResultValueType]'], bool]) -> 'Result[_ResultValueType]':
-        if pred(self):
-            return Result[_ResultValueType](children=[self])
-        else:
-            return self.where_children(pred)
+        return Result(children=list(self._iter_where([self], pred)))
 
     def where_children(self, pred: Callable[['Result[_ResultValueType]'], bool]) -> 'Result[_ResultValueType]':
-        child_results: MutableSequence[Result[_ResultValueType]] = []
-        for child in self.children:
-            for child_result in child.where(pred).children:
-                child_results.append(child_result)
-        return Result[_ResultValueType](children=child_results)
+        return Result(children=list(self._iter_where(self.children, pred)))
+
+    @staticmethod
+    def _iter_where(
+        results: Sequence['Result[_ResultValueType]'],
+        pred: Callable[['Result[_ResultValueType]'], bool],
+    ) -> Iterator['Result[_ResultValueType]']:
+        # Pre-order walk that doesn't descend into matching results.
+        stack: MutableSequence[Result[_ResultValueType]] = list(
+            reversed(results))
+        while stack:
+            result: Result[_ResultValueType] = stack.pop()
+            if pred(result):
+                yield result
+            else:
+                stack.extend(reversed(result.children))
 
     def skip(self) -> 'Result[_ResultValueType]':
-        return Result[_ResultValueType](children=self.children)
+        return Result(children=self.children)
 
     def where_n(self, n: int, pred: Callable[['Result[_ResultValueType]'], bool]) -> 'Result[_ResultValueType]':
         result: Result[_ResultValueType] = self.where(pred)
@@ -69,12 +119,17 @@ class Result(Generic[_ResultValueType]):
         return self.where_n(1, pred).children[0]
 
     @staticmethod
+    @functools.lru_cache(maxsize=256)
     def rule_name_is(rule_name: str) -> Callable[['Result[_ResultValueType]'], bool]:
+        # Loaders build these per lookup, so share one predicate per name.
+        # Callers can pass any name, so only the recent ones are kept.
         return lambda result: result.rule_name == rule_name
 
     @staticmethod
-    def rule_name_in(rule_names: Sequence[str]) -> Callable[['Result[_ResultValueType]'], bool]:
-        return lambda result: result.rule_name in rule_names
+    def rule_name_in(rule_names: Collection[str]) -> Callable[['Result[_ResultValueType]'], bool]:
+        # Hash membership regardless of the collection the caller passed.
+        rule_name_set: frozenset[str] = frozenset(rule_names)
+        return lambda result: result.rule_name in rule_name_set
 
     def has_value(self) -> bool:
         return self.value is not None
@@ -91,44 +146,113 @@ class StateValue(ABC):
     @abstractproperty
     def empty(self) -> bool: ...
 
+    @property
+    def memo_key(self) -> Optional[Hashable]:
+        # Identifies this value within a single apply for memoization, or
+        # None if rule applications to this value shouldn't be memoized.
+        return None
+
 
 _StateValueType = TypeVar('_StateValueType', bound=StateValue)
 
 
-@dataclass(frozen=True, repr=False)
+_Memo = MutableMapping[
+    tuple[str, Hashable],
+    Union['ResultAndState[_ResultValueType,_StateValueType]', 'Error', None],
+]
+
+
+@dataclass(frozen=True, repr=False, eq=False, init=False)
 class State(Generic[_ResultValueType, _StateValueType]):
+    # One of these is built per consumed item. Slotted like Result, which
+    # rules out a field default, so __init__ and __eq__ are written out.
+    __slots__ = ('processor', 'value', 'memo')
+
     processor: 'Processor[_ResultValueType,_StateValueType]'
     value: _StateValueType
+    memo: _Memo
+
+    def __init__(
+        self,
+        processor: 'Processor[_ResultValueType,_StateValueType]',
+        value: _StateValueType,
+        memo: Optional[_Memo] = None,
+    ) -> None:
+        object.__setattr__(self, 'processor', processor)
+        object.__setattr__(self, 'value', value)
+        object.__setattr__(self, 'memo', {} if memo is None else memo)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, State):
+            return NotImplemented
+        return self.processor == other.processor and self.value == other.value
+
+    def __getstate__(self) -> tuple[object, ...]:
+        return self.processor, self.value, self.memo
+
+    def __setstate__(self, state: tuple[object, ...]) -> None:
+        for name, value in zip(State.__slots__, state):
+            object.__setattr__(self, name, value)
 
     def __repr__(self) -> str:
         return repr(self.value)
 
     def with_value(self, value: _StateValueType) -> 'State[_ResultValueType,_StateValueType]':
-        return State[_ResultValueType, _StateValueType](self.processor, value)
+        # Called once per consumed item, so construct the class directly
+        # rather than through the slower subscripted generic alias.
+        return State(self.processor, value, self.memo)
 
 
 @dataclass(frozen=True)
 class ResultAndState(Generic[_ResultValueType, _StateValueType]):
+    __slots__ = ('result', 'state')
+
     result: Result[_ResultValueType]
     state: State[_ResultValueType, _StateValueType]
 
     def with_rule_name(self, rule_name: str) -> 'ResultAndState[_ResultValueType,_StateValueType]':
-        return ResultAndState[_ResultValueType, _StateValueType](self.result.with_rule_name(rule_name), self.state)
+        if self.result.rule_name == rule_name:
+            return self
+        return ResultAndState(self.result.with_rule_name(rule_name), self.state)
 
     def as_child_result(self) -> 'ResultAndState[_ResultValueType,_StateValueType]':
-        return ResultAndState[_ResultValueType, _StateValueType](
-            Result[_ResultValueType](
-                children=[self.result],
+        return ResultAndState(
+            Result(
+                children=(self.result,),
             ),
             self.state
         )
 
 
 class Rule(ABC, Generic[_ResultValueType, _StateValueType]):
+    __slots__ = ()
+
+    def __getstate__(self) -> Mapping[str, object]:
+        # Frozen slotted rules can't be unpickled through setattr, so pickle
+        # every slot explicitly and restore with object.__setattr__.
+        state: MutableMapping[str, object] = dict(getattr(self, '__dict__', {}))
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get('__slots__', ()):
+                state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state: Mapping[str, object]) -> None:
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+
     @abstractmethod
     def apply(self, state: State[_ResultValueType, _StateValueType]) -> ResultAndState[_ResultValueType, _StateValueType]:
         ...
 
+    def try_apply(self, state: State[_ResultValueType, _StateValueType]) -> Optional[ResultAndState[_ResultValueType, _StateValueType]]:
+        # Like apply but returns None on a mismatch, for callers that would
+        # only discard the error. Rules that can fail cheaply override this
+        # to skip building the error at all.
+        try:
+            return self.apply(state)
+        except Error:
+            return None
+
 
 @dataclass(frozen=True)
 class Processor(Generic[_ResultValueType, _StateValueType]):
@@ -140,15 +264,80 @@ class Processor(Generic[_ResultValueType, _StateValueType]):
         rule_name: str,
         state: State[_ResultValueType, _StateValueType]
     ) -> ResultAndState[_ResultValueType, _StateValueType]:
-        if rule_name not in self.rules:
+        # One lookup serves both the unknown rule check and the apply.
+        rule: Optional[Rule[_ResultValueType, _StateValueType]] = self.rules.get(
+            rule_name)
+        if rule is None:
             raise Error(msg=f'unknown rule {rule_name}')
+        value_key: Optional[Hashable] = state.value.memo_key
+        if value_key is None:
+            return self._apply_rule_to_state(rule_name, rule, state)
+        key: tuple[str, Hashable] = (rule_name, value_key)
+        if key in state.memo:
+            memo_result = state.memo[key]
+            if isinstance(memo_result, Error):
+                # Raise a copy so the memoized error never picks up a
+                # traceback, whose frames would keep this state alive.
+                raise replace(memo_result)
+            if memo_result is not None:
+                return memo_result
         try:
-            return self.rules[rule_name].apply(state).with_rule_name(rule_name)
+            result: ResultAndState[_ResultValueType, _StateValueType] = self._apply_rule_to_state(
+                rule_name, rule, state)
+        except Error as error:
+            state.memo[key] = replace(error)
+            raise
+        state.memo[key] = result
+        return result
+
+    def try_apply_rule_to_state(
+        self,
+        rule_name: str,
+        state: State[_ResultValueType, _StateValueType]
+    ) -> Optional[ResultAndState[_ResultValueType, _StateValueType]]:
+        # Shares the memo with apply_rule_to_state, recording a failure as
+        # None until some caller needs its error built.
+        rule: Optional[Rule[_ResultValueType, _StateValueType]] = self.rules.get(
+            rule_name)
+        if rule is None:
+            return None
+        if type(rule).try_apply is Rule.try_apply:
+            # The default try_apply builds the error anyway, so memoize it
+            # rather than applying the rule again if the error is needed.
+            try:
+                return self.apply_rule_to_state(rule_name, state)
+            except Error:
+                return None
+        value_key: Optional[Hashable] = state.value.memo_key
+        if value_key is None:
+            result = rule.try_apply(state)
+            return None if result is None else result.with_rule_name(rule_name)
+        key: tuple[str, Hashable] = (rule_name, value_key)
+        if key in state.memo:
+            memo_result = state.memo[key]
+            if memo_result is None or isinstance(memo_result, Error):
+                return None
+            return memo_result
+        result: Optional[ResultAndState[_ResultValueType,
+                                        _StateValueType]] = rule.try_apply(state)
+        if result is not None:
+            result = result.with_rule_name(rule_name)
+        state.memo[key] = result
+        return result
+
+    @staticmethod
+    def _apply_rule_to_state(
+        rule_name: str,
+        rule: Rule[_ResultValueType, _StateValueType],
+        state: State[_ResultValueType, _StateValueType]
+    ) -> ResultAndState[_ResultValueType, _StateValueType]:
+        try:
+            return rule.apply(state).with_rule_name(rule_name)
         except Error as error:
             raise error.with_rule_name(rule_name)
 
     def apply_rule(self, rule_name: str, state_value: _StateValueType) -> ResultAndState[_ResultValueType, _StateValueType]:
-        return self.apply_rule_to_state(rule_name, State[_ResultValueType, _StateValueType](self, state_value))
+        return self.apply_rule_to_state(rule_name, State(self, state_value))
 
     def apply_root(self, state_value: _StateValueType) -> ResultAndState[_ResultValueType, _StateValueType]:
         return self.apply_rule(self.root_rule_name, state_value)
@@ -156,6 +345,10 @@ class Processor(Generic[_ResultValueType, _StateValueType]):
 
 @dataclass(frozen=True)
 class Ref(Rule[_ResultValueType, _StateValueType]):
+    # Declared by hand rather than with slots=True: these rules are built
+    # through subscripted aliases like lexer.And, which set __orig_class__
+    # and trip the frozen __setattr__ of a slots=True copy of the class.
+    __slots__ = ('rule_name',)
     rule_name: str
 
     def __repr__(self) -> str:
@@ -167,11 +360,20 @@ class Ref(Rule[_ResultValueType, _StateValueType]):
         except Error as error:
             raise Error(children=[error])
 
+    def try_apply(self, state: State[_ResultValueType, _StateValueType]) -> Optional[ResultAndState[_ResultValueType, _StateValueType]]:
+        result: Optional[ResultAndState[_ResultValueType, _StateValueType]] = state.processor.try_apply_rule_to_state(
+            self.rule_name, state)
+        return None if result is None else result.as_child_result()
+
 
 @dataclass(frozen=True)
 class And(Rule[_ResultValueType, _StateValueType]):
+    __slots__ = ('children',)
     children: Sequence[Rule[_ResultValueType, _StateValueType]]
 
+    def __post_init__(self):
+        object.__setattr__(self, 'children', tuple(self.children))
+
     def __repr__(self) -> str:
         return f'({" ".join([str(child) for child in self.children])})'
 
@@ -184,28 +386,60 @@ class And(Rule[_ResultValueType, _StateValueType]):
                                          _StateValueType] = child.apply(child_state)
             child_results.append(child_result.result)
             child_state = child_result.state
-        return ResultAndState[_ResultValueType, _StateValueType](Result[_ResultValueType](children=child_results), child_state)
+        return ResultAndState(Result(children=child_results), child_state)
+
+    def try_apply(self, state: State[_ResultValueType, _StateValueType]) -> Optional[ResultAndState[_ResultValueType, _StateValueType]]:
+        child_results: MutableSequence[Result[_ResultValueType]] = [
+        ]
+        child_state: State[_ResultValueType, _StateValueType] = state
+        for child in self.children:
+            child_result: Optional[ResultAndState[_ResultValueType,
+                                                  _StateValueType]] = child.try_apply(child_state)
+            if child_result is None:
+                return None
+            child_results.append(child_result.result)
+            child_state = child_result.state
+        return ResultAndState(Result(children=child_results), child_state)
 
 
 @dataclass(frozen=True)
 class Or(Rule[_ResultValueType, _StateValueType]):
+    __slots__ = ('children',)
     children: Sequence[Rule[_ResultValueType, _StateValueType]]
 
+    def __post_init__(self):
+        object.__setattr__(self, 'children', tuple(self.children))
+
     def __repr__(self) -> str:
         return f'({"|".join([str(child) for child in self.children])})'
 
     def apply(self, state: State[_ResultValueType, _StateValueType]) -> ResultAndState[_ResultValueType, _StateValueType]:
+        result: Optional[ResultAndState[_ResultValueType,
+                                        _StateValueType]] = self.try_apply(state)
+        if result is not None:
+            return result
+        # Alternatives that fail before one matches are usually discarded,
+        # so their errors are only built once every alternative has failed.
         child_errors: MutableSequence[Error] = []
         for child in self.children:
             try:
-                return child.apply(state).as_child_result()
+                child.apply(state)
             except Error as error:
                 child_errors.append(error)
         raise Error(children=child_errors)
 
+    def try_apply(self, state: State[_ResultValueType, _StateValueType]) -> Optional[ResultAndState[_ResultValueType, _StateValueType]]:
+        for child in self.children:
+            child_result: Optional[ResultAndState[_ResultValueType,
+                                                  _StateValueType]] = child.try_apply(state)
+            if child_result is not None:
+                return child_result.as_child_result()
+        return None
+
 
 @dataclass(frozen=True)
 class ZeroOrMore(Rule[_ResultValueType, _StateValueType]):
+    __slots__ = ('child',)
     child: Rule[_ResultValueType, _StateValueType]
 
     def __repr__(self) -> str:
@@ -216,18 +450,18 @@ class ZeroOrMore(Rule[_ResultValueType, _StateValueType]):
         ]
         child_state: State[_ResultValueType, _StateValueType] = state
         while True:
-            try:
-                child_result: ResultAndState[_ResultValueType,
-                                             _StateValueType] = self.child.apply(child_state)
-                child_results.append(child_result.result)
-                child_state = child_result.state
-            except Error:
+            child_result: Optional[ResultAndState[_ResultValueType,
+                                                  _StateValueType]] = self.child.try_apply(child_state)
+            if child_result is None:
                 break
-        return ResultAndState[_ResultValueType, _StateValueType](Result[_ResultValueType](children=child_results), child_state)
+            child_results.append(child_result.result)
+            child_state = child_result.state
+        return ResultAndState(Result(children=child_results), child_state)
 
 
 @dataclass(frozen=True)
 class OneOrMore(Rule[_ResultValueType, _StateValueType]):
+    __slots__ = ('child',)
     child: Rule[_ResultValueType, _StateValueType]
 
     def __repr__(self) -> str:
@@ -241,31 +475,34 @@ class OneOrMore(Rule[_ResultValueType, _StateValueType]):
         child_state: State[_ResultValueType,
                            _StateValueType] = child_result.state
         while True:
-            try:
-                child_result = self.child.apply(child_state)
-                child_results.append(child_result.result)
-                child_state = child_result.state
-            except Error:
+            next_child_result: Optional[ResultAndState[_ResultValueType,
+                                                       _StateValueType]] = self.child.try_apply(child_state)
+            if next_child_result is None:
                 break
-        return ResultAndState[_ResultValueType, _StateValueType](Result[_ResultValueType](children=child_results), child_state)
+            child_results.append(next_child_result.result)
+            child_state = next_child_result.state
+        return ResultAndState(Result(children=child_results), child_state)
 
 
 @dataclass(frozen=True)
 class ZeroOrOne(Rule[_ResultValueType, _StateValueType]):
+    __slots__ = ('child',)
     child: Rule[_ResultValueType, _StateValueType]
 
     def __repr__(self) -> str:
         return f'{self.child}?'
 
     def apply(self, state: State[_ResultValueType, _StateValueType]) -> ResultAndState[_ResultValueType, _StateValueType]:
-        try:
-            return self.child.apply(state).as_child_result()
-        except Error:
-            return ResultAndState[_ResultValueType, _StateValueType](Result[_ResultValueType](), state)
+        child_result: Optional[ResultAndState[_ResultValueType,
+                                              _StateValueType]] = self.child.try_apply(state)
+        if child_result is None:
+            return ResultAndState(Result(), state)
+        return child_result.as_child_result()
 
 
 @dataclass(frozen=True)
 class UntilEmpty(Rule[_ResultValueType, _StateValueType]):
+    __slots__ = ('child',)
     child: Rule[_ResultValueType, _StateValueType]
 
     def __repr__(self) -> str:
@@ -283,4 +520,4 @@ class UntilEmpty(Rule[_ResultValueType, _StateValueType]):
                     msg=f'{self} not advancing from {child_state} with result {child_result.result}')
             child_state = child_result.state
             child_results.append(child_result.result)
-        return ResultAndState[_ResultValueType, _StateValueType](Result[_ResultValueType](children=child_results), child_state)
+        return ResultAndState(Result(children=child_results), child_state)
@@ -1,5 +1,7 @@
 from dataclasses import dataclass, field
 from functools import cached_property
+import pickle
+import traceback
 from typing import Generic, Optional, Sequence, TypeVar
 import unittest
 
@@ -137,6 +139,10 @@ class ResultTest(unittest.TestCase):
             )
         )
 
+    def test_with_same_rule_name(self):
+        result = _Result(value=_ResultValue(1), rule_name='a')
+        self.assertIs(result.with_rule_name('a'), result)
+
     def test_where_rule_name_is(self):
         self.assertEqual(
             _Result(
@@ -269,6 +275,23 @@ class ResultTest(unittest.TestCase):
             _Result(rule_name='a', value=_ResultValue(1))
         )
 
+    def test_eq_children_sequence(self):
+        self.assertEqual(_Result(), _Result(children=[]))
+        self.assertEqual(
+            _Result(children=(_Result(value=_ResultValue(1)),)),
+            _Result(children=[_Result(value=_ResultValue(1))])
+        )
+        self.assertNotEqual(_Result(), _Result(children=[_Result()]))
+
+    def test_pickle(self):
+        result = _Result(
+            rule_name='a',
+            children=[
+                _Result(value=_ResultValue(1)),
+            ]
+        )
+        self.assertEqual(pickle.loads(pickle.dumps(result)), result)
+
 
 @dataclass(frozen=True)
 class _StateValue(processor.StateValue):
@@ -843,3 +866,129 @@ class IntMatcherTest(ProcessorTest[_ResultValue, _StateValue]):
                 )
             ]
         )
+
+
+@dataclass(frozen=True)
+class _MemoStateValue(_StateValue):
+    @property
+    def memo_key(self) -> int:
+        return len(self.values)
+
+    @cached_property
+    def tail(self) -> '_MemoStateValue':
+        assert not self.empty
+        return _MemoStateValue(self.values[1:])
+
+
+@dataclass(frozen=True)
+class _CountingRule(_Rule):
+    child: _Rule
+    applies: list[int] = field(default_factory=list, compare=False)
+
+    def apply(self, state: _State) -> _ResultAndState:
+        self.applies.append(len(state.value.values))
+        return self.child.apply(state)
+
+
+class MemoTest(unittest.TestCase):
+    def test_memoizes_rule_per_position(self):
+        b = _CountingRule(_IntMatcherLiteral(1))
+        matcher = _IntMatcher(
+            'a',
+            {
+                'a': _Or([
+                    _And([_Ref('b'), _IntMatcherLiteral(2)]),
+                    _And([_Ref('b'), _IntMatcherLiteral(3)]),
+                ]),
+                'b': b,
+            }
+        )
+        matcher.apply_root(_MemoStateValue([1, 3]))
+        self.assertEqual(b.applies, [2])
+        with self.assertRaises(processor.Error):
+            matcher.apply_root(_MemoStateValue([2]))
+        self.assertEqual(b.applies, [2, 1])
+
+    def test_memoized_error_has_no_traceback(self):
+        matcher = _IntMatcher('a', {'a': _CountingRule(_IntMatcherLiteral(1))})
+        state: _State = _State(matcher, _MemoStateValue([2]))
+        # assertRaises drops the traceback, so catch the errors directly.
+        errors: list[processor.Error] = []
+        for _ in range(3):
+            try:
+                matcher.apply_rule_to_state('a', state)
+            except processor.Error as error:
+                errors.append(error)
+        self.assertEqual(len(errors), 3)
+        self.assertEqual(errors[1], errors[0])
+        self.assertEqual(
+            len(list(traceback.walk_tb(errors[2].__traceback__))),
+            len(list(traceback.walk_tb(errors[1].__traceback__))))
+        for memo_result in state.memo.values():
+            assert isinstance(memo_result, processor.Error)
+            self.assertIsNone(memo_result.__traceback__)
+
+
+class TryApplyTest(unittest.TestCase):
+    def test_try_apply(self):
+        matcher = _IntMatcher(
+            'a',
+            {
+                'a': _And([
+                    _Or([_Ref('b'), _IntMatcherLiteral(2)]),
+                    _ZeroOrMore(_IntMatcherLiteral(3)),
+                    _ZeroOrOne(_IntMatcherLiteral(4)),
+                ]),
+                'b': _IntMatcherLiteral(1),
+            }
+        )
+        rule: _Rule = matcher.rules['a']
+        for values in [[1], [2, 3, 3], [1, 4], [2, 3, 4, 5]]:
+            with self.subTest(values):
+                state: _State = _State(matcher, _StateValue(values))
+                self.assertEqual(rule.try_apply(state), rule.apply(state))
+        for values in [[], [3], [4, 1]]:
+            with self.subTest(values):
+                state = _State(matcher, _StateValue(values))
+                self.assertIsNone(rule.try_apply(state))
+                with self.assertRaises(processor.Error):
+                    rule.apply(state)
+
+    def test_or_error_after_try_apply(self):
+        matcher = _IntMatcher(
+            'a',
+            {
+                'a': _Or([_Ref('b'), _And([_Ref('b')])]),
+                'b': _And([_IntMatcherLiteral(1)]),
+            }
+        )
+        with self.assertRaises(processor.Error) as cm:
+            matcher.apply_root(_MemoStateValue([2]))
+        with self.assertRaises(processor.Error) as b_cm:
+            matcher.apply_rule('b', _MemoStateValue([2]))
+        self.assertEqual(
+            cm.exception,
+            processor.Error(rule_name='a', children=[
+                processor.Error(children=[b_cm.exception]),
+                processor.Error(children=[b_cm.exception]),
+            ])
+        )
+
+
+class ErrorTest(unittest.TestCase):
+    def test_str(self):
+        self.assertEqual(
+            str(processor.Error(rule_name='a', children=[
+                processor.Error(children=[processor.Error(msg='b')]),
+                processor.Error(rule_name='c', msg='d', children=[
+                    processor.Error(rule_name='e'),
+                ]),
+            ])),
+            '\na \n   b\n  c d\n    e \n'
+        )
+
+    def test_str_deep(self):
+        error: processor.Error = processor.Error(msg='a')
+        for _ in range(10000):
+            error = processor.Error(rule_name='b', children=[error])
+        self.assertTrue(str(error).endswith(f'{"  "*10000} a\n'))
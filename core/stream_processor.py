@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import Generic, Sequence, TypeVar
+from typing import Generic, Optional, Sequence, TypeVar
 
 from core import processor
 
@@ -10,27 +10,39 @@ _ResultValueType = TypeVar('_ResultValueType', bound=processor.ResultValue)
 Error = processor.Error
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, eq=False)
 class Stream(processor.StateValue, Generic[_ItemType]):
     _values: Sequence[_ItemType]
+    _pos: int = 0
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Stream):
+            return NotImplemented
+        if self._values is other._values:
+            return self._pos == other._pos
+        return tuple(self._values[self._pos:]) == tuple(other._values[other._pos:])
 
     @property
     def empty(self) -> bool:
-        return len(self._values) == 0
+        return self._pos >= len(self._values)
+
+    @property
+    def memo_key(self) -> int:
+        return self._pos
 
     @property
     def head(self) -> _ItemType:
         if self.empty:
             raise Error(msg='stream empty')
         else:
-            return self._values[0]
+            return self._values[self._pos]
 
     @property
     def tail(self) -> 'Stream[_ItemType]':
         if self.empty:
             raise Error(msg='stream empty')
         else:
-            return self.__class__(self._values[1:])
+            return self.__class__(self._values, self._pos + 1)
 
 
 @dataclass(frozen=True)
@@ -53,6 +65,8 @@ UntilEmpty = processor.UntilEmpty[_ResultValueType, Stream[_ItemType]]
 
 
 class HeadRule(Rule[_ResultValueType, _ItemType], ABC):
+    __slots__ = ()
+
     @abstractmethod
     def pred(self, head: _ItemType) -> bool: ...
 
@@ -60,16 +74,30 @@ class HeadRule(Rule[_ResultValueType, _ItemType], ABC):
     def result(self, head: _ItemType) -> Result[_ResultValueType]: ...
 
     def apply(self, state: State[_ResultValueType, _ItemType]) -> ResultAndState[_ResultValueType, _ItemType]:
-        if self.pred(state.value.head):
-            return ResultAndState[_ResultValueType, _ItemType](
-                self.result(state.value.head),
-                state.with_value(state.value.tail)
+        value: Stream[_ItemType] = state.value
+        head: _ItemType = value.head
+        if self.pred(head):
+            return processor.ResultAndState(
+                self.result(head),
+                state.with_value(value.tail)
             )
         else:
-            raise Error(msg=f'{self} failed to match head {state.value.head}')
-
-
-@dataclass(frozen=True)
+            raise Error(msg=f'{self} failed to match head {head}')
+
+    def try_apply(self, state: State[_ResultValueType, _ItemType]) -> Optional[ResultAndState[_ResultValueType, _ItemType]]:
+        value: Stream[_ItemType] = state.value
+        if value.empty:
+            return None
+        head: _ItemType = value.head
+        if not self.pred(head):
+            return None
+        return processor.ResultAndState(
+            self.result(head),
+            state.with_value(value.tail)
+        )
+
+
+@dataclass(frozen=True, slots=True)
 class Literal(HeadRule[_ResultValueType, _ItemType]):
     value: _ItemType
 
@@ -141,9 +141,10 @@ def load(input: str) -> Sequence[Expr]:
     result = parser_.apply(input)
 
     def dict_loader(expr_loaders: Mapping[str, Callable[[parser.Result], Expr]]) -> Callable[[parser.Result], Expr]:
+        pred = parser.Result.rule_name_in(expr_loaders.keys())
+
         def closure(result: parser.Result) -> Expr:
-            expr_result = result.where_one(
-                parser.Result.rule_name_in(list(expr_loaders.keys())))
+            expr_result = result.where_one(pred)
             assert expr_result.rule_name is not None
             return expr_loaders[expr_result.rule_name](expr_result)
         return closure